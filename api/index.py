@@ -3,7 +3,13 @@ Vercel serverless function entry point for FastAPI application
 This file is used by Vercel to serve the FastAPI app as a serverless function
 
 Vercel's @vercel/python runtime automatically detects and wraps ASGI applications
-(like FastAPI), so we just need to import and expose the app.
+(like FastAPI), so we just need to build and expose the app.
+
+Every cold start pays for whatever is loaded here, so this builds the lightweight
+app: API routers are imported on the first request that needs them and no
+background cache warming is started (see backend/app_factory.py). Nothing runs
+python -m backend.init_db on Vercel, so the schema is created before the first
+API router loads.
 """
 import sys
 import os
@@ -13,9 +19,8 @@ import os
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
-# Import the FastAPI app from the backend
-from backend.main import app
+from backend.app_factory import create_app
 
 # Vercel's @vercel/python runtime automatically wraps ASGI apps
 # The app variable will be used by Vercel's runtime
-
+app = create_app(lazy_routers=True, warm_caches=False, create_schema=True)
@@ -0,0 +1,273 @@
+"""
+Builds the FastAPI application.
+
+    create_app()                                       everything loaded up front (backend.main, uvicorn)
+    create_app(lazy_routers=True, warm_caches=False,   serverless entry (api/index.py)
+               create_schema=True)
+
+A serverless instance pays its whole startup on the request that wakes it, so
+the lazy app only loads what that request needs: the API routers (and with them
+SQLAlchemy, the models and the schemas) are imported the first time a request
+reaches their prefix, /health and the other core routes need none of it, and no
+background cache warming is started. With create_schema the schema is created
+(init_db, idempotent) just before the first router loads, since a fresh
+serverless instance has no separate init step and may not run the lifespan. The OCR stack is loaded lazily by every
+app, on the first scan (see backend/core/ocrmodule.py).
+"""
+import asyncio
+import importlib
+import os
+import time
+from contextlib import asynccontextmanager
+
+from pydantic import BaseModel
+from fastapi import APIRouter, FastAPI, Depends, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from backend.auth import create_session, require_auth
+from backend.core import metrics, profiling, logs, audit
+
+# prefix -> module with the APIRouter `router` for it
+API_ROUTERS = {
+    "/doctor": "backend.routers.doctor",
+    "/patient": "backend.routers.patient",
+    "/clinicadmin": "backend.routers.clinicadmin",
+    "/analytics": "backend.routers.analytics",
+}
+# paths that describe every route, so all routers are loaded first
+DOCS_PATHS = ("/openapi.json", "/docs", "/docs/oauth2-redirect", "/redoc")
+
+log = logs.get_logger("app")
+
+
+def make_lifespan(warm_caches: bool):
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        """Per-worker startup/shutdown. Keep this cheap: it runs in every worker and every cold start"""
+        # Schema creation normally runs once out of band (python -m backend.init_db,
+        # called by start_server.py / railway_start.py). INIT_DB_ON_STARTUP=1 does it here instead.
+        if os.getenv("INIT_DB_ON_STARTUP") == "1":
+            from backend.db import init_db
+
+            init_db()
+
+        # The OCR stack loads on the first scan. OCR_PRELOAD=1 warms it in the background
+        # so the first scan doesn't pay for it, without delaying startup.
+        if os.getenv("OCR_PRELOAD") == "1":
+            from backend.core import ocrmodule
+
+            asyncio.get_running_loop().run_in_executor(None, ocrmodule.load_ocr)
+
+        # emergency cards: warmed and kept fresh by a background thread, startup doesn't wait for it
+        emergency = None
+        if warm_caches:
+            from backend.core import emergency
+
+            emergency.start()
+
+        yield
+
+        if emergency:
+            emergency.stop()
+        # write out whatever is still queued in the background audit and log writers
+        audit.shutdown()
+        logs.shutdown_logging()
+
+    return lifespan
+
+
+""" LAZY ROUTERS """
+
+def include_api_router(app: FastAPI, prefix: str):
+    start = time.perf_counter()
+    module = importlib.import_module(API_ROUTERS[prefix])
+    app.include_router(module.router, prefix=prefix)
+    return time.perf_counter() - start
+
+
+class LazyRouterMiddleware:
+    """Includes each API router on the first request under its prefix"""
+
+    def __init__(self, app, fastapi_app: FastAPI, create_schema: bool = False):
+        self.app = app
+        self.fastapi_app = fastapi_app
+        self.pending = set(API_ROUTERS)
+        self.create_schema = create_schema
+
+    def _load(self, prefix: str):
+        # plain imports, nothing awaits in between, so a router can't be included twice
+        if prefix in self.pending:
+            if self.create_schema:
+                # every API router needs the tables; once per instance
+                from backend.db import init_db
+
+                self.create_schema = False
+                init_db()
+            self.pending.discard(prefix)
+            seconds = include_api_router(self.fastapi_app, prefix)
+            log.info("router loaded", extra={"fields": {"prefix": prefix, "ms": round(seconds * 1000, 1)}})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.pending:
+            path = scope["path"]
+            root_path = scope.get("root_path", "")
+            if root_path and path.startswith(root_path):
+                path = path[len(root_path):]
+            if path in DOCS_PATHS:
+                for prefix in sorted(self.pending):
+                    self._load(prefix)
+            else:
+                for prefix in list(self.pending):
+                    if path == prefix or path.startswith(prefix + "/"):
+                        self._load(prefix)
+        await self.app(scope, receive, send)
+
+
+""" APP """
+
+def mount_frontend(app: FastAPI):
+    # Get the project root directory
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    frontend_dir = os.path.join(project_root, "frontend")
+
+    # Mount static files (CSS, JS, images, etc.)
+    if os.path.exists(frontend_dir):
+        app.mount("/assets", StaticFiles(directory=os.path.join(frontend_dir, "assets")), name="assets")
+        app.mount("/css", StaticFiles(directory=os.path.join(frontend_dir, "css")), name="css")
+        app.mount("/js", StaticFiles(directory=os.path.join(frontend_dir, "js")), name="js")
+
+        # Mount login pages
+        login_dir = os.path.join(frontend_dir, "loginPages")
+        if os.path.exists(login_dir):
+            app.mount("/loginPages", StaticFiles(directory=login_dir), name="loginPages")
+
+        # Mount pages directory (serves files at /pages/filename.html)
+        pages_dir = os.path.join(frontend_dir, "pages")
+        if os.path.exists(pages_dir):
+            app.mount("/pages", StaticFiles(directory=pages_dir), name="pages")
+
+
+def create_app(lazy_routers: bool = False, warm_caches: bool = True, create_schema: bool = False):
+    # Detect if running on Vercel (serverless) vs local development vs Railway
+    root_path = "/api" if os.getenv("VERCEL") else None
+    app = FastAPI(root_path=root_path, lifespan=make_lifespan(warm_caches))
+
+    # Serve static frontend files (only in production/Railway, not in local dev)
+    # In local dev, frontend is served separately on port 8080
+    if os.getenv("RAILWAY_ENVIRONMENT") or os.getenv("PORT"):
+        mount_frontend(app)
+
+    # Include API routers (these come after static mounts, so /pages/* won't match /doctor/*)
+    if lazy_routers:
+        # on first use instead. Added before the other middleware so it is the innermost:
+        # a router's first request is still timed and profiled, its import included
+        app.add_middleware(LazyRouterMiddleware, fastapi_app=app, create_schema=create_schema)
+    else:
+        if create_schema:
+            from backend.db import init_db
+
+            init_db()
+        for prefix in API_ROUTERS:
+            include_api_router(app, prefix)
+
+    # Configure CORS to allow frontend requests (including file:// protocol with null origin)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allow all origins for local development (including null)
+        allow_credentials=False,  # Must be False when using allow_origins=["*"]
+        allow_methods=["*"],  # Allows all methods (GET, POST, PUT, DELETE, etc.)
+        allow_headers=["*"],  # Allows all headers including Authorization
+        expose_headers=["*"],  # Expose all headers to the frontend
+    )
+
+    # Profiles admin-requested (X-Profile: 1) and randomly sampled requests, see backend/core/profiling.py
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+    # Added last so it is the outermost middleware and times the whole request
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    app.include_router(core_router)
+    return app
+
+
+""" WEBSITE HEALTH CHECK """
+
+core_router = APIRouter()
+
+@core_router.get("/health")
+def root_health():
+    return {"Hello":"Health check positive"}
+
+@core_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus scrape endpoint (per worker process)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@core_router.get("/")
+def homepage_quickreturn():
+    """Serve index.html in production, or return JSON in API-only mode"""
+    if os.getenv("RAILWAY_ENVIRONMENT") or os.getenv("PORT"):
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        index_path = os.path.join(project_root, "frontend", "index.html")
+        if os.path.exists(index_path):
+            return FileResponse(index_path)
+    return {"Hello":"Homepage quick return"}
+
+# Serve HTML files directly (for production)
+@core_router.get("/index.html")
+def serve_index():
+    """Serve index.html"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    index_path = os.path.join(project_root, "frontend", "index.html")
+    if os.path.exists(index_path):
+        return FileResponse(index_path)
+    return {"error": "index.html not found"}
+
+""" REQUEST PROFILES """
+
+@core_router.get("/profiles")
+def list_request_profiles(session=Depends(require_auth(["clinic_admin"]))):
+    """Stored request profiles, slowest first"""
+    return {"profiles": profiling.list_profiles()}
+
+@core_router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_request_profile(profile_id: str, session=Depends(require_auth(["clinic_admin"]))):
+    """Folded stacks for one profile, ready for flamegraph.pl or speedscope"""
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile.folded())
+
+# Note: FastAPI serves routes in order, so API routes (above) are checked first
+# Static file mounts handle CSS/JS/assets
+# HTML files are served via explicit routes or the mounts above
+
+""" MOCK AUTHENTICATION """
+
+class MockLoginRequest(BaseModel):
+    user_id: int
+    role: str
+
+@core_router.post("/auth/login")
+def mock_login(data: MockLoginRequest):
+    if data.role not in ["patient", "doctor", "clinic_admin"]:
+        raise HTTPException(status_code=400, detail="Invalid role")
+
+    token = create_session(data.user_id, data.role)
+
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "role": data.role
+    }
+
+
+"""
+token requirement usage example:
+
+@app.get("/scan")
+def doctor_scan(session=Depends(require_role("doctor"))):
+    return {"ok": True}
+"""
@@ -2,10 +2,15 @@
 import secrets
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, Header
+from backend.core.metrics import Counter, Gauge
 
 SESSIONS = {}
 SESSION_TTL = timedelta(hours=1)
 
+SESSIONS_ACTIVE = Gauge("session_store_size", "Sessions held in the in-memory session store", function=lambda: len(SESSIONS))
+SESSIONS_CREATED = Counter("sessions_created_total", "Sessions issued by /auth/login", ["role"])
+SESSION_LOOKUPS = Counter("session_lookups_total", "Session store lookups by outcome", ["result"])
+
 def create_session(user_id: int, role: str):
     token = secrets.token_urlsafe(32)
 
@@ -15,17 +20,28 @@ def create_session(user_id: int, role: str):
         "issued_at": datetime.utcnow(),
         "expires": datetime.utcnow() + SESSION_TTL
     }
+    SESSIONS_CREATED.inc(role=role)
 
     return token
 
-def get_session(authorization: str = Header(...)):
+def lookup_session(authorization: str):
+    """(session, "hit") for a live token, else (None, "missing") or (None, "expired")"""
     token = authorization.replace("Bearer ", "")
     session = SESSIONS.get(token)
 
     if not session:
-        raise HTTPException(status_code=401)
+        return None, "missing"
 
     if session["expires"] < datetime.utcnow():
+        return None, "expired"
+
+    return session, "hit"
+
+def get_session(authorization: str = Header(...)):
+    session, result = lookup_session(authorization)
+    SESSION_LOOKUPS.inc(result=result)
+
+    if not session:
         raise HTTPException(status_code=401)
 
     return session
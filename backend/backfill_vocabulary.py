@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+"""
+Link every stored patient to the clinical vocabulary (see backend/core/vocabulary.py).
+Run once after upgrading, and again whenever patients were written without going
+through the API (bulk imports, the benchmark seeder). Safe to re-run:
+
+    python -m backend.backfill_vocabulary
+"""
+from backend.db import init_db
+from backend.core import vocabulary, sharding
+
+
+def main():
+    init_db()
+    for n in range(sharding.SHARD_COUNT):
+        db = sharding.session_factory(n)()
+        try:
+            stats = vocabulary.backfill(
+                db, progress=lambda s: print(f"  {s['patients']} patients, {s['links']} links", end="\r", flush=True)
+            )
+        finally:
+            db.close()
+        print(f"\n[OK] Vocabulary backfilled: {stats['patients']} patients, {stats['links']} links ({sharding.shard_url(n)})")
+
+
+if __name__ == "__main__":
+    main()
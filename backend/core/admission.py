@@ -0,0 +1,214 @@
+"""
+Admission control for OCR.
+
+A Tesseract run costs seconds of CPU, and /patient/mykadscan/initial needs no
+login, so OCR is guarded twice:
+  - per client: a token bucket keyed by the logged-in user (or client IP when
+    there is no valid session), checked by the `rate_limit_ocr` dependency on
+    the scan routes
+  - globally: at most OCR_MAX_CONCURRENCY scans run at once; up to OCR_MAX_QUEUE
+    more may wait, for at most OCR_QUEUE_TIMEOUT seconds (`ocr_slot`). Queued
+    OCR jobs wait separately and get a slot only when no such scan is waiting
+
+Anything over those limits gets an immediate 429 with Retry-After instead of
+piling up and slowing every other request down.
+
+Environment: OCR_MAX_CONCURRENCY (default: CPU count), OCR_MAX_QUEUE (8),
+OCR_QUEUE_TIMEOUT (2 seconds), OCR_RATE_PER_MINUTE (10), OCR_BURST (5),
+TRUST_PROXY_HEADERS (1 to key anonymous clients on X-Forwarded-For).
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, Request, status
+
+from backend.auth import lookup_session
+from backend.core.metrics import Counter, Gauge, Histogram
+
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", "8"))
+OCR_QUEUE_TIMEOUT = float(os.getenv("OCR_QUEUE_TIMEOUT", "2"))
+OCR_RATE_PER_MINUTE = float(os.getenv("OCR_RATE_PER_MINUTE", "10"))
+OCR_BURST = int(os.getenv("OCR_BURST", "5"))
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS") == "1"
+
+# upper bound on remembered clients, least recently seen are forgotten first
+MAX_TRACKED_CLIENTS = 10000
+
+OCR_QUEUE_DEPTH = Gauge("ocr_queue_depth", "OCR requests waiting for a slot")
+OCR_IN_PROGRESS = Gauge("ocr_in_progress", "OCR requests currently running")
+OCR_QUEUE_WAIT = Histogram("ocr_queue_wait_seconds", "Time OCR requests waited for a slot")
+OCR_REJECTIONS = Counter("ocr_rejections_total", "OCR requests rejected with 429", ["reason"])
+
+
+def _too_many_requests(detail: str, retry_after: float):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+""" PER-CLIENT RATE LIMIT """
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+
+class RateLimiter:
+    """Token bucket per client key: `burst` requests at once, refilled at `per_minute`"""
+
+    def __init__(self, per_minute: float, burst: int, max_clients: int = MAX_TRACKED_CLIENTS):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str):
+        """Spend one token. Returns 0 if allowed, otherwise seconds until a token is available"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0.0
+            return (1 - bucket.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+OCR_RATE_LIMITER = RateLimiter(OCR_RATE_PER_MINUTE, OCR_BURST)
+
+
+def client_key(request: Request):
+    """The session's user when logged in, otherwise the client address"""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        # only a live session counts: any other value could be made up per request
+        # to get a fresh bucket (and push real clients' buckets out)
+        session, _ = lookup_session(authorization)
+        if session is not None:
+            return f"user:{session['role']}:{session['user_id']}"
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return "ip:" + forwarded.split(",")[0].strip()
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+def rate_limit_ocr(request: Request):
+    """Dependency for OCR routes: 429 once this client has used up its scans"""
+    retry_after = OCR_RATE_LIMITER.take(client_key(request))
+    if retry_after:
+        OCR_REJECTIONS.inc(reason="rate_limited")
+        raise _too_many_requests("Too many scans, please wait before trying again", retry_after)
+
+
+""" GLOBAL CONCURRENCY LIMIT """
+
+class ConcurrencyLimiter:
+    """At most `limit` holders; at most `max_queue` waiters, each for at most `timeout` seconds.
+
+    Callers that bound their own backlog (the OCR job queue) wait with bounded=False:
+    as long as needed, not counted against `max_queue`, and only handed a slot when
+    no bounded caller is waiting, so a job backlog never makes interactive scans
+    time out or get rejected."""
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_use = 0
+        # futures of waiting callers, oldest first; a slot is handed over by resolving one
+        self._waiters = deque()
+        self._background = deque()
+
+    @property
+    def waiting(self):
+        """Bounded callers waiting for a slot"""
+        return len(self._waiters)
+
+    def _hand_over(self):
+        while self.in_use < self.limit:
+            queue = self._waiters or self._background
+            if not queue:
+                return
+            waiter = queue.popleft()
+            if not waiter.done():
+                self.in_use += 1
+                waiter.set_result(None)
+
+    def _release(self):
+        self.in_use -= 1
+        self._hand_over()
+
+    async def _acquire(self, bounded: bool):
+        """Seconds waited for a slot"""
+        # background callers also let queued bounded callers go first
+        queued = self._waiters if bounded else (self._waiters or self._background)
+        if self.in_use < self.limit and not queued:
+            self.in_use += 1
+            return 0.0
+
+        if bounded and self.waiting >= self.max_queue:
+            OCR_REJECTIONS.inc(reason="queue_full")
+            raise _too_many_requests("OCR service is busy, please try again shortly", self.timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._waiters if bounded else self._background
+        queue.append(waiter)
+        OCR_QUEUE_DEPTH.inc()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.timeout if bounded else None)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as we gave up: pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                if waiter in queue:
+                    queue.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                OCR_REJECTIONS.inc(reason="queue_timeout")
+                raise _too_many_requests("OCR service is busy, please try again shortly", self.timeout)
+            raise
+        finally:
+            OCR_QUEUE_DEPTH.dec()
+        return time.perf_counter() - start
+
+    @asynccontextmanager
+    async def slot(self, bounded: bool = True):
+        """Hold a slot. bounded=False waits as long as needed, behind every bounded caller"""
+        OCR_QUEUE_WAIT.observe(await self._acquire(bounded))
+        OCR_IN_PROGRESS.inc()
+        try:
+            yield
+        finally:
+            OCR_IN_PROGRESS.dec()
+            self._release()
+
+
+OCR_LIMITER = ConcurrencyLimiter(OCR_MAX_CONCURRENCY, OCR_MAX_QUEUE, OCR_QUEUE_TIMEOUT)
+
+
+def ocr_slot(bounded: bool = True):
+    """Hold one of the global OCR slots: `async with ocr_slot(): ...`"""
+    return OCR_LIMITER.slot(bounded)
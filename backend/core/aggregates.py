@@ -0,0 +1,173 @@
+"""
+Cohort counts for the analytics dashboard, kept up to date as patients are written.
+
+Instead of counting over `patients` and its child tables on every dashboard
+refresh, one small table holds the number of patients per bucket:
+
+    patient_aggregates(dimension, bucket, count)   -- PRIMARY KEY (dimension, bucket)
+
+    total              ""                    every registered patient
+    blood_type         "O-", "AB+" ...
+    sex                "male", "female" ...
+    birth_year         "1987" ...            age bands are worked out when read,
+                                             so the counts don't go stale as people age
+    chronic_condition  vocabulary term       patients with that condition
+    medication         vocabulary term       patients prescribed it at least once
+
+Registration and clinic updates add to the counts in their own transaction
+(record_registration, record_new_terms), so the numbers move with the data.
+`python -m backend.reconcile_aggregates` recounts everything from scratch,
+reports where the stored counts had drifted, and stores the fresh ones.
+Each shard counts its own patients; the endpoint adds the shards up.
+"""
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import Integer, String, select, delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Mapped, Session, mapped_column
+
+from backend.db import Base
+from backend.core import patient_logic, sharding, vocabulary
+
+# (label, youngest, oldest) in whole years; None = no upper bound
+AGE_BANDS = [("0-17", 0, 17), ("18-39", 18, 39), ("40-59", 40, 59), ("60-79", 60, 79), ("80+", 80, None)]
+
+RECOUNT_BATCH = 5000
+
+
+class PatientAggregate(Base):
+    __tablename__ = "patient_aggregates"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    dimension: Mapped[str] = mapped_column(String, primary_key=True)
+    bucket: Mapped[str] = mapped_column(String, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+""" INCREMENTAL UPDATES """
+
+def patient_buckets(blood_type, sex, birth_date, chronic_conditions):
+    """(dimension, bucket) pairs one patient counts towards; medications are counted as they are prescribed"""
+    buckets = [("total", "")]
+    if blood_type:
+        buckets.append(("blood_type", blood_type.strip().upper()))
+    if sex:
+        buckets.append(("sex", sex.strip().lower()))
+    if birth_date:
+        buckets.append(("birth_year", str(birth_date)[:4]))
+    conditions = {vocabulary.normalize_term(c) for c in chronic_conditions or []}
+    buckets += [("chronic_condition", c) for c in conditions if c]
+    return buckets
+
+
+def increment(db: Session, buckets):
+    """Add 1 per (dimension, bucket) occurrence, in the caller's transaction"""
+    counts = Counter(buckets)
+    if not counts:
+        return
+    statement = insert(PatientAggregate)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["dimension", "bucket"],
+            set_={"count": PatientAggregate.count + statement.excluded.count},
+        ),
+        [{"dimension": d, "bucket": b, "count": n} for (d, b), n in counts.items()],
+    )
+
+
+def record_registration(db: Session, patient):
+    increment(db, patient_buckets(patient.blood_type, patient.sex, patient.birth_date, patient.chronic_conditions))
+
+
+def record_new_terms(db: Session, dimension: str, terms):
+    """Count a patient once more for each term they didn't have before (see vocabulary.link_terms)"""
+    increment(db, [(dimension, term) for term in terms])
+
+
+""" RECOUNT """
+
+def recount(db: Session):
+    """Counter of (dimension, bucket) -> patients, computed from the patient data itself"""
+    counts = Counter()
+    Patient = patient_logic.Patient
+    after = 0
+    while True:
+        rows = db.execute(
+            select(Patient.id, Patient.blood_type, Patient.sex, Patient.birth_date, Patient.chronic_conditions)
+            .where(Patient.id > after).order_by(Patient.id).limit(RECOUNT_BATCH)
+        ).all()
+        if not rows:
+            break
+        for _, blood_type, sex, birth_date, conditions in rows:
+            counts.update(patient_buckets(blood_type, sex, birth_date, conditions))
+        after = rows[-1][0]
+
+    Prescription = patient_logic.MedicationPrescription
+    seen = set()
+    for patient_id, name in db.execute(select(Prescription.patient_id, Prescription.prescription_name)):
+        term = vocabulary.normalize_term(name)
+        if term and (patient_id, term) not in seen:
+            seen.add((patient_id, term))
+            counts[("medication", term)] += 1
+    return counts
+
+
+def reconcile(db: Session, fix: bool = True):
+    """Recount from scratch; returns the drift [(dimension, bucket, stored, actual)] and stores the recount if `fix`"""
+    actual = recount(db)
+    stored = {
+        (d, b): n for d, b, n in db.execute(select(PatientAggregate.dimension, PatientAggregate.bucket, PatientAggregate.count))
+    }
+    drift = [
+        (d, b, stored.get((d, b), 0), actual.get((d, b), 0))
+        for d, b in sorted(set(stored) | set(actual))
+        if stored.get((d, b), 0) != actual.get((d, b), 0)
+    ]
+    if fix:
+        db.execute(delete(PatientAggregate))
+        if actual:
+            db.execute(insert(PatientAggregate), [{"dimension": d, "bucket": b, "count": n} for (d, b), n in actual.items()])
+        db.commit()
+    return drift
+
+
+""" READING """
+
+def age_band(birth_year: int, today: date):
+    # from the year of birth only, so people move up a band up to a year early
+    age = today.year - birth_year
+    for label, youngest, oldest in AGE_BANDS:
+        if age >= youngest and (oldest is None or age <= oldest):
+            return label
+    return None
+
+
+def _stored_counts(db: Session):
+    return db.execute(
+        select(PatientAggregate.dimension, PatientAggregate.bucket, PatientAggregate.count)
+        .where(PatientAggregate.count > 0)
+    ).all()
+
+
+def summary(today: date | None = None):
+    """Counts per dimension for the analytics endpoint, summed over every shard"""
+    today = today or date.today()
+    counts = Counter()
+    for rows in sharding.fan_out(_stored_counts):
+        for dimension, bucket, count in rows:
+            counts[(dimension, bucket)] += count
+
+    result = {"total": 0, "blood_type": {}, "sex": {}, "age_band": {label: 0 for label, _, _ in AGE_BANDS},
+              "chronic_condition": {}, "medication": {}}
+    # biggest buckets first
+    for (dimension, bucket), count in sorted(counts.items(), key=lambda item: (item[0][0], -item[1])):
+        if dimension == "total":
+            result["total"] = count
+        elif dimension == "birth_year":
+            label = age_band(int(bucket), today) if bucket.isdigit() else None
+            if label:
+                result["age_band"][label] += count
+        elif dimension in result:
+            result[dimension][bucket] = count
+    return result
@@ -0,0 +1,284 @@
+"""
+Access audit log.
+
+Every read and change of patient data, and every MyKad scan with its raw OCR
+text, is recorded as one row in a separate append-only SQLite database:
+
+    ts, action, actor_id, actor_role, route, method, client,
+    nric, patient_id, outcome, raw_ocr, detail (JSON)
+
+Routes call `record(...)`, which only puts the event on an in-memory queue.
+A background thread writes queued events in batches (one transaction per
+batch), so auditing adds no write to the request's own transaction and no
+contention with app.db. The queue is bounded: when the writer can't keep up,
+new events are dropped and counted in audit_events_dropped_total instead of
+slowing requests down. Pending events are flushed on shutdown. If the store
+can't be opened (path not writable, database locked), the writer keeps retrying
+with backoff and events queue up meanwhile.
+
+The store refuses UPDATE and DELETE (triggers), so rows can only be added.
+
+Environment: AUDIT_DB_PATH (default: next to the app database, app.db ->
+app.audit.db), AUDIT_QUEUE_SIZE (10000), AUDIT_BATCH_SIZE (500),
+AUDIT_FLUSH_INTERVAL (1 second).
+"""
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from backend.core.logs import get_logger
+from backend.core.metrics import Counter, Gauge, Histogram, route_template
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))
+
+# attempts to write a batch before its events are given up on
+WRITE_ATTEMPTS = 3
+# longest wait between attempts to open the audit store
+CONNECT_RETRY_MAX = 30.0
+
+log = get_logger("audit")
+
+COLUMNS = ("ts", "action", "actor_id", "actor_role", "route", "method", "client",
+           "nric", "patient_id", "outcome", "raw_ocr", "detail")
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS audit_events (
+        id INTEGER PRIMARY KEY,
+        ts TEXT NOT NULL,
+        action TEXT NOT NULL,
+        actor_id TEXT,
+        actor_role TEXT,
+        route TEXT,
+        method TEXT,
+        client TEXT,
+        nric TEXT,
+        patient_id INTEGER,
+        outcome TEXT,
+        raw_ocr TEXT,
+        detail TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS audit_events_nric ON audit_events (nric, ts)",
+    "CREATE INDEX IF NOT EXISTS audit_events_actor ON audit_events (actor_id, ts)",
+    """
+    CREATE TRIGGER IF NOT EXISTS audit_events_no_update BEFORE UPDATE ON audit_events BEGIN
+        SELECT RAISE(ABORT, 'audit_events is append-only');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS audit_events_no_delete BEFORE DELETE ON audit_events BEGIN
+        SELECT RAISE(ABORT, 'audit_events is append-only');
+    END
+    """,
+]
+
+AUDIT_EVENTS_WRITTEN = Counter("audit_events_written_total", "Audit events written to the audit store")
+AUDIT_EVENTS_DROPPED = Counter("audit_events_dropped_total", "Audit events lost", ["reason"])
+AUDIT_FLUSH_LATENCY = Histogram("audit_flush_seconds", "Time to write one batch of audit events")
+
+
+def default_audit_path():
+    """AUDIT_DB_PATH, else alongside the SQLite app database"""
+    path = os.getenv("AUDIT_DB_PATH")
+    if path:
+        return path
+    from backend.db import DATABASE_URL
+
+    if DATABASE_URL.startswith("sqlite:///") and DATABASE_URL != "sqlite:///:memory:":
+        root, _ = os.path.splitext(DATABASE_URL[len("sqlite:///"):])
+        return root + ".audit.db"
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit.db")
+
+
+""" WRITER """
+
+class AuditWriter:
+    """Owns the queue and the background thread that drains it into the audit database"""
+
+    def __init__(self, path: str, queue_size: int, batch_size: int, flush_interval: float):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def put(self, event: dict):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            AUDIT_EVENTS_DROPPED.inc(reason="queue_full")
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        return conn
+
+    def _take_batch(self, timeout):
+        """Up to batch_size events, waiting at most `timeout` for the first one"""
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=timeout))
+        except queue.Empty:
+            return batch
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn, batch):
+        rows = [tuple(event.get(column) for column in COLUMNS) for event in batch]
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            start = time.perf_counter()
+            try:
+                with conn:
+                    conn.executemany(f"INSERT INTO audit_events ({', '.join(COLUMNS)}) VALUES ({placeholders})", rows)
+                AUDIT_FLUSH_LATENCY.observe(time.perf_counter() - start)
+                AUDIT_EVENTS_WRITTEN.inc(len(rows))
+                return
+            except sqlite3.Error as e:
+                log.error("audit write failed", extra={"fields": {"attempt": attempt, "events": len(rows), "error": str(e)}})
+                if attempt < WRITE_ATTEMPTS:
+                    time.sleep(self.flush_interval)
+        AUDIT_EVENTS_DROPPED.inc(len(rows), reason="write_error")
+
+    def _connect_with_retry(self):
+        """Connection to the audit store, retrying with backoff; None if stopped first"""
+        delay = self.flush_interval
+        while not self._stop.is_set():
+            try:
+                return self._connect()
+            except sqlite3.Error as e:
+                log.error("audit store unavailable", extra={"fields": {"path": self.path, "error": str(e), "retry_in": delay}})
+                self._stop.wait(delay)
+                delay = min(delay * 2, CONNECT_RETRY_MAX)
+        return None
+
+    def _run(self):
+        try:
+            conn = self._connect_with_retry()
+            if conn is None:
+                # stopped before the store ever opened
+                while True:
+                    batch = self._take_batch(0)
+                    if not batch:
+                        return
+                    AUDIT_EVENTS_DROPPED.inc(len(batch), reason="store_unavailable")
+            self._drain(conn)
+        finally:
+            # however the writer ended, the next event can start a new one
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                    self._stop.clear()
+
+    def _drain(self, conn):
+        try:
+            while not self._stop.is_set():
+                batch = self._take_batch(self.flush_interval)
+                if batch:
+                    self._write(conn, batch)
+            # shutting down: write out everything still queued
+            while True:
+                batch = self._take_batch(0)
+                if not batch:
+                    break
+                self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def shutdown(self, timeout: float = 10.0):
+        with self._lock:
+            self._stop.set()
+            thread = self._thread
+        # not holding the lock, so put() isn't blocked while the queue is flushed
+        if thread is not None:
+            thread.join(timeout)
+        # a later event (e.g. the app started again in the same process) starts a new writer, but
+        # only once this one has exited: it clears _stop itself if the join timed out
+        with self._lock:
+            if self._thread is thread and (thread is None or not thread.is_alive()):
+                self._thread = None
+                self._stop.clear()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditWriter(default_audit_path(), AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL)
+    return _writer
+
+
+AUDIT_QUEUE_DEPTH = Gauge("audit_queue_depth", "Audit events waiting to be written",
+                          function=lambda: _writer.queue.qsize() if _writer else 0)
+
+
+def shutdown():
+    """Flush pending events and stop the writer (lifespan shutdown, atexit)"""
+    if _writer is not None:
+        _writer.shutdown()
+
+
+atexit.register(shutdown)
+
+
+""" RECORDING """
+
+def request_context(request=None, session=None):
+    """Who is asking and through which route; kept for events recorded after the request (OCR jobs)"""
+    context = {"actor_id": None, "actor_role": None, "route": None, "method": None, "client": None}
+    if session:
+        context["actor_id"] = str(session.get("user_id"))
+        context["actor_role"] = session.get("role")
+    if request is not None:
+        context["route"] = route_template(request.scope) or request.url.path
+        context["method"] = request.method
+        context["client"] = request.client.host if request.client else None
+    return context
+
+
+def record(action: str, request=None, session=None, context=None, nric=None, patient_id=None,
+           outcome: str = "ok", raw_ocr=None, **detail):
+    """Queue one audit event; never blocks and never raises into the request"""
+    event = dict(context) if context else request_context(request, session)
+    event.update({
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "action": action,
+        "nric": nric,
+        "patient_id": patient_id,
+        "outcome": outcome,
+        "raw_ocr": raw_ocr,
+        "detail": json.dumps(detail, default=str) if detail else None,
+    })
+    get_writer().put(event)
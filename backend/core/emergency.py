@@ -0,0 +1,305 @@
+"""
+Emergency cards: the few fields a doctor needs first, served from memory.
+
+GET /doctor/emergency?nric=... returns blood type, allergies, chronic
+conditions, advanced directives and emergency contacts (plus the name, to
+confirm it's the right person). Each worker keeps an LRU index of compact
+EmergencyCard records keyed by NRIC digits, so a hit is a dict lookup with no
+database work:
+
+  - warmed at startup in the background with the most recently registered
+    patients (EMERGENCY_WARM, default: fill the index)
+  - bounded to EMERGENCY_INDEX_SIZE cards (50000); least recently used go first
+  - a miss reads the patient from the database and caches the card
+  - a background thread polls the change_seq columns (backend/core/sync.py)
+    of every shard every EMERGENCY_REFRESH_INTERVAL seconds (1) and reloads
+    cached cards whose patient or contacts changed, whichever worker made the change
+
+EMERGENCY_INDEX_SIZE=0 turns the index off; every lookup then reads the database,
+as it does in apps built without cache warming (the serverless entry).
+"""
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import select, text, true
+
+from backend.core import patient_logic, sharding
+from backend.core.logs import get_logger
+from backend.core.metrics import Counter, Gauge
+
+EMERGENCY_INDEX_SIZE = int(os.getenv("EMERGENCY_INDEX_SIZE", "50000"))
+EMERGENCY_WARM = int(os.getenv("EMERGENCY_WARM", str(EMERGENCY_INDEX_SIZE)))
+EMERGENCY_REFRESH_INTERVAL = float(os.getenv("EMERGENCY_REFRESH_INTERVAL", "1"))
+
+# patients loaded per query when warming
+WARM_BATCH = 2000
+
+log = get_logger("emergency")
+
+EMERGENCY_LOOKUPS = Counter("emergency_lookups_total", "Emergency card lookups", ["result"])
+
+
+class EmergencyCard:
+    __slots__ = ("patient_id", "nric_number", "full_name", "blood_type", "allergies", "chronic_conditions",
+                 "advanced_directives", "emergency_contacts")
+
+    def __init__(self, patient_id, nric_number, full_name, blood_type, allergies, chronic_conditions, advanced_directives, contacts):
+        self.patient_id = patient_id
+        # as stored, so "900101145678" and "900101-14-5678" lookups return the same card
+        self.nric_number = nric_number
+        self.full_name = full_name
+        self.blood_type = blood_type
+        self.allergies = tuple(allergies or ())
+        self.chronic_conditions = tuple(chronic_conditions or ())
+        self.advanced_directives = tuple(advanced_directives or ())
+        # (name, contact_number, address, additional_info)
+        self.emergency_contacts = tuple(contacts)
+
+    def to_dict(self):
+        return {
+            "user_id": str(self.patient_id),
+            "nric_number": self.nric_number,
+            "full_name": self.full_name,
+            "blood_type": self.blood_type,
+            "allergies": list(self.allergies),
+            "chronic_conditions": list(self.chronic_conditions),
+            "advanced_directives": list(self.advanced_directives),
+            "emergency_contacts": [
+                {"name": name, "contact_number": number, "address": address, "additional_info": info}
+                for name, number, address, info in self.emergency_contacts
+            ],
+        }
+
+
+def nric_key(nric: str):
+    return re.sub(r"\D", "", nric or "")
+
+
+def load_cards(db, condition, order_by=None, limit=None):
+    """[(NRIC key, EmergencyCard)] for the patients matching `condition`: one query for them, one for their contacts"""
+    Patient, Contact = patient_logic.Patient, patient_logic.EmergencyContact
+    query = select(Patient.id, Patient.nric_number, Patient.full_name, Patient.blood_type, Patient.allergies,
+                   Patient.chronic_conditions, Patient.advanced_directives).where(condition)
+    if order_by is not None:
+        query = query.order_by(order_by)
+    if limit is not None:
+        query = query.limit(limit)
+    patients = db.execute(query).all()
+    if not patients:
+        return []
+
+    contacts = defaultdict(list)
+    for patient_id, *contact in db.execute(
+        select(Contact.patient_id, Contact.name, Contact.contact_number, Contact.address, Contact.additional_info)
+        .where(Contact.patient_id.in_([p.id for p in patients]))
+        .order_by(Contact.id)
+    ):
+        contacts[patient_id].append(tuple(contact))
+
+    return [
+        (nric_key(p.nric_number), EmergencyCard(p.id, p.nric_number, p.full_name, p.blood_type, p.allergies,
+                                                p.chronic_conditions, p.advanced_directives, contacts.get(p.id, ())))
+        for p in patients
+    ]
+
+
+""" INDEX """
+
+class EmergencyIndex:
+    """NRIC digits -> EmergencyCard, least recently used first"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._cards = OrderedDict()
+        self._nric_by_patient = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cards)
+
+    def get(self, key: str):
+        with self._lock:
+            card = self._cards.get(key)
+            if card is not None:
+                self._cards.move_to_end(key)
+            return card
+
+    def put(self, key: str, card: EmergencyCard, recent: bool = True):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._cards[key] = card
+            self._nric_by_patient[card.patient_id] = key
+            if not recent:
+                # warming: don't push out cards that were actually asked for
+                self._cards.move_to_end(key, last=False)
+            while len(self._cards) > self.max_size:
+                _, evicted = self._cards.popitem(last=False)
+                self._nric_by_patient.pop(evicted.patient_id, None)
+
+    def discard_patient(self, patient_id: int):
+        with self._lock:
+            key = self._nric_by_patient.pop(patient_id, None)
+            if key is not None:
+                self._cards.pop(key, None)
+
+    def cached_patients(self, patient_ids):
+        with self._lock:
+            return [p for p in patient_ids if p in self._nric_by_patient]
+
+    def clear(self):
+        with self._lock:
+            self._cards.clear()
+            self._nric_by_patient.clear()
+
+
+# caches nothing until start(): without the refresher, cards could go stale
+index = EmergencyIndex(0)
+
+EMERGENCY_INDEX_CARDS = Gauge("emergency_index_cards", "Emergency cards held in this worker's index", function=lambda: len(index))
+
+
+def lookup(nric: str):
+    """(card dict, source) for an NRIC, source "index" or "database"; (None, None) if no such patient"""
+    key = nric_key(nric)
+    card = index.get(key)
+    if card is not None:
+        EMERGENCY_LOOKUPS.inc(result="hit")
+        return card.to_dict(), "index"
+
+    db = sharding.session_for(key)
+    try:
+        caching = index.max_size > 0
+        # taken before the read: a change committed after it is either in the card or found below
+        seen = _current_seq(db) if caching else None
+        # the stored NRIC may or may not have dashes
+        formatted = f"{key[:6]}-{key[6:8]}-{key[8:]}"
+        cards = load_cards(db, patient_logic.Patient.nric_number.in_([nric, key, formatted]), limit=1)
+        if not cards:
+            EMERGENCY_LOOKUPS.inc(result="not_found")
+            return None, None
+        stored_key, card = cards[0]
+        if caching:
+            index.put(stored_key, card)
+            # the refresher may have polled a newer change while the card wasn't cached yet and
+            # moved past it; such a card would never be refreshed, so don't keep it
+            db.rollback()
+            if card.patient_id in changed_patients(db, seen):
+                index.discard_patient(card.patient_id)
+    finally:
+        db.close()
+    EMERGENCY_LOOKUPS.inc(result="miss")
+    return card.to_dict(), "database"
+
+
+""" WARMING AND REFRESH """
+
+def _current_seq(db):
+    return db.execute(text("SELECT seq FROM change_counter WHERE id = 1")).scalar() or 0
+
+
+def warm(db, count: int, since: int, stop: threading.Event):
+    """Load the `count` most recently registered patients, catching up on changes between batches"""
+    Patient = patient_logic.Patient
+    loaded, before = 0, None
+    while loaded < count and not stop.is_set():
+        condition = Patient.id < before if before is not None else true()
+        cards = load_cards(db, condition, Patient.id.desc(), min(WARM_BATCH, count - loaded))
+        if not cards:
+            break
+        for key, card in cards:
+            index.put(key, card, recent=False)
+        loaded += len(cards)
+        before = cards[-1][1].patient_id
+        since = refresh(db, since)
+        db.rollback()
+    return loaded, since
+
+
+def changed_patients(db, since: int):
+    """Ids of patients whose card fields or contacts changed after change_seq `since`"""
+    rows = db.execute(text("""
+        SELECT id FROM patients WHERE change_seq > :since
+        UNION SELECT patient_id FROM emergency_contacts WHERE change_seq > :since
+        UNION SELECT patient_id FROM sync_tombstones WHERE change_seq > :since AND table_name IN ('patients', 'emergency_contacts')
+    """), {"since": since})
+    return [row[0] for row in rows]
+
+
+def refresh(db, since: int):
+    """Reload cached cards changed after `since`; returns the change_seq it caught up to"""
+    current = _current_seq(db)
+    if current <= since:
+        return since
+    stale = index.cached_patients(changed_patients(db, since))
+    for patient_id in stale:
+        index.discard_patient(patient_id)
+    if stale:
+        for key, card in load_cards(db, patient_logic.Patient.id.in_(stale)):
+            index.put(key, card)
+    return current
+
+
+class _Refresher:
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or EMERGENCY_INDEX_SIZE <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="emergency-index", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # one session and one change_seq position per shard
+        sessions = [sharding.session_factory(n)() for n in range(sharding.SHARD_COUNT)]
+        try:
+            if sharding.engine_for(0).dialect.name != "sqlite":
+                raise RuntimeError("change tracking needs SQLite")
+            since = [_current_seq(db) for db in sessions]
+            # the newest registrations of every shard
+            per_shard = -(-min(EMERGENCY_WARM, EMERGENCY_INDEX_SIZE) // len(sessions))
+            loaded = 0
+            for n, db in enumerate(sessions):
+                count, since[n] = warm(db, per_shard, since[n], self._stop)
+                loaded += count
+            log.info("emergency index warmed", extra={"fields": {"cards": loaded}})
+            while not self._stop.wait(EMERGENCY_REFRESH_INTERVAL):
+                for n, db in enumerate(sessions):
+                    since[n] = refresh(db, since[n])
+                    # end the read transaction so the next poll sees new commits
+                    db.rollback()
+        except Exception as e:
+            # no change tracking (schema not migrated, not SQLite). Cards could go stale without refreshes,
+            # so stop caching and read every lookup from the database instead
+            log.error("emergency index disabled", extra={"fields": {"error": str(e)}})
+            index.max_size = 0
+            index.clear()
+        finally:
+            for db in sessions:
+                db.close()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+
+_refresher = _Refresher()
+
+
+def start():
+    """Warm the index and keep it fresh in a background thread (lifespan startup)"""
+    index.max_size = EMERGENCY_INDEX_SIZE
+    _refresher.start()
+
+
+def stop():
+    _refresher.stop()
+    index.max_size = 0
+    index.clear()
@@ -0,0 +1,184 @@
+"""
+Structured, non-blocking application logging.
+
+Records from `get_logger()` loggers are put on an in-memory queue and written as
+one JSON object per line by a background thread, so a slow stdout never adds
+latency to a request. Pass structured data in `extra={"fields": {...}}`:
+
+    log = get_logger("ocr")
+    log.info("ocr finished", extra={"fields": {"nric": nric, "name": name}})
+    log.debug("image opened", extra={"fields": {"size": img.size}, "verbose": True})
+
+- Card data (NRIC, names, raw OCR text) is redacted by the writer thread, both
+  by field name and by NRIC pattern in messages. Never put card data in the
+  message text itself; names can only be redacted when they are a field.
+- Records marked `"verbose": True` are kept with probability LOG_VERBOSE_SAMPLE_RATE.
+- When the queue is full records are dropped (and counted) instead of blocking.
+- After shutdown_logging, records are redacted and written synchronously.
+
+Environment: LOG_LEVEL (default INFO), LOG_VERBOSE_SAMPLE_RATE (default 0.1),
+LOG_QUEUE_SIZE (default 10000).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+
+from backend.core.metrics import Counter
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_VERBOSE_SAMPLE_RATE = float(os.getenv("LOG_VERBOSE_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+ROOT_LOGGER = "lifelink"
+
+# field names whose values are never written as-is
+REDACTED_FIELDS = {"name", "full_name", "raw_ocr", "ocr_text"}
+NRIC_FIELDS = {"nric", "nric_number"}
+NRIC_PATTERN = re.compile(r"\b(\d{6})[- ]?(\d{2})[- ]?(\d{4})\b")
+
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records not written", ["reason"])
+
+
+def mask_nric(value):
+    """Keep only the last 4 digits of an NRIC"""
+    if value is None:
+        return None
+    digits = re.sub(r"\D", "", str(value))
+    return "******-**-" + digits[-4:] if len(digits) >= 4 else "[REDACTED]"
+
+
+def _mask_nrics(text: str):
+    return NRIC_PATTERN.sub(lambda m: "******-**-" + m.group(3), text)
+
+
+class RedactionFilter(logging.Filter):
+    """Masks NRICs and removes names/raw OCR text before a record is written"""
+
+    def filter(self, record):
+        record.msg = _mask_nrics(record.getMessage())
+        record.args = None
+        fields = getattr(record, "fields", None)
+        if fields:
+            redacted = {}
+            for key, value in fields.items():
+                if key in NRIC_FIELDS:
+                    redacted[key] = mask_nric(value)
+                elif key in REDACTED_FIELDS:
+                    redacted[key] = None if value is None else "[REDACTED]"
+                elif isinstance(value, str):
+                    redacted[key] = _mask_nrics(value)
+                else:
+                    redacted[key] = value
+            record.fields = redacted
+        return True
+
+
+class VerboseSamplingFilter(logging.Filter):
+    """Keeps only a sample of records marked verbose"""
+
+    def filter(self, record):
+        if getattr(record, "verbose", False) and random.random() >= LOG_VERBOSE_SAMPLE_RATE:
+            LOG_RECORDS_DROPPED.inc(reason="sampled")
+            return False
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of erroring or blocking when the queue is full"""
+
+    def prepare(self, record):
+        # format the traceback here, the writer thread can't see the live exception
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def _stdout_writer():
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(JsonFormatter())
+    writer.addFilter(RedactionFilter())
+    return writer
+
+
+def configure_logging():
+    """Set up the queue handler and start the writer thread, once per process"""
+    global _listener
+    if _listener is not None:
+        return
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+        queue_handler = _DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(VerboseSamplingFilter())
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        # replaces the synchronous writer left by an earlier shutdown_logging
+        root.handlers.clear()
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, _stdout_writer(), respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            # background threads and atexit hooks still log after this. Without a handler their
+            # records would reach logging.lastResort on stderr unredacted, so write them here instead
+            writer = _stdout_writer()
+            writer.addFilter(VerboseSamplingFilter())
+            root = logging.getLogger(ROOT_LOGGER)
+            root.handlers.clear()
+            root.addHandler(writer)
+
+
+def get_logger(name: str):
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -0,0 +1,338 @@
+"""
+In-process metrics exposed at /metrics in the Prometheus text format.
+
+Standard library only, so importing this module is cheap and it can be left on
+permanently. Each worker process keeps its own registry.
+
+    REQUEST_LATENCY.observe(0.12, method="GET", route="/health")
+    with ocr_stage("preprocess"):
+        ...
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+REGISTRY = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+OCR_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        # unlabelled gauges can be computed at scrape time instead of being kept up to date
+        self._function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket (non-cumulative, last slot is +Inf), sum]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render():
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+""" HTTP ROUTES """
+
+REQUESTS_TOTAL = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled", ["method", "route"]
+)
+
+""" DATABASE """
+
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Duration of a single SQL statement"
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request", ["route"], buckets=QUERY_COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Total SQL time per HTTP request", ["route"]
+)
+
+""" OCR """
+
+OCR_STAGE_LATENCY = Histogram(
+    "ocr_stage_duration_seconds", "Time spent in each OCR stage (decode, preprocess, psm_*, extraction)", ["stage"], buckets=OCR_BUCKETS
+)
+
+
+# optional per-call collector for stage timings, see collect_ocr_stages
+_ocr_stage_timings = contextvars.ContextVar("ocr_stage_timings", default=None)
+
+
+@contextmanager
+def ocr_stage(stage: str):
+    """Time one OCR stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        OCR_STAGE_LATENCY.observe(elapsed, stage=stage)
+        timings = _ocr_stage_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+@contextmanager
+def collect_ocr_stages():
+    """Collect the stage timings of the OCR calls made inside the block into a dict (stage -> seconds)"""
+    timings = {}
+    token = _ocr_stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _ocr_stage_timings.reset(token)
+
+
+""" PER-REQUEST DATABASE STATS """
+
+class _RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# set by MetricsMiddleware; the object is shared with the threadpool that runs sync routes
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine):
+    """Count and time every SQL statement executed by this engine, attributed to the current request"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_LATENCY.observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        # keep the start-time stack balanced when a statement fails
+        starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+        if starts:
+            starts.pop()
+
+
+""" MIDDLEWARE """
+
+_MAX_ROUTE_CACHE = 1024
+
+
+def route_template(scope):
+    """Route template recorded in the scope by FastAPI's router once the request was routed"""
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    return getattr(context, "path", None)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, in-flight requests and DB usage"""
+
+    def __init__(self, app):
+        self.app = app
+        # raw path -> route template, so /doctor/viewpatientdata/profile is matched once
+        self._route_cache = {}
+
+    def _match_route(self, scope):
+        """Route template for this request, None if only routing can resolve it: inside an included router, or
+        under a prefix whose router isn't mounted yet (LazyRouterMiddleware)"""
+        from starlette.routing import Match
+
+        for candidate in scope["app"].router.routes:
+            match, _ = candidate.matches(scope)
+            if match != Match.NONE:
+                # flat routes (and every route on older FastAPI versions) carry their full path
+                return getattr(candidate, "path", None)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        path = scope["path"]
+        route = self._route_cache.get(path) or self._match_route(scope)
+        # the first request to a path inside an included router is only resolved after routing
+        label = route or "unresolved"
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        REQUESTS_IN_FLIGHT.inc(method=method, route=label)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec(method=method, route=label)
+            _request_stats.reset(token)
+            if route is None:
+                route = route_template(scope) or "unmatched"
+            # unmatched paths are not cached so random 404s can't grow the cache
+            if route != "unmatched" and path not in self._route_cache and len(self._route_cache) < _MAX_ROUTE_CACHE:
+                self._route_cache[path] = route
+            REQUESTS_TOTAL.inc(method=method, route=route, status=str(status_code))
+            REQUEST_LATENCY.observe(elapsed, method=method, route=route)
+            DB_QUERIES_PER_REQUEST.observe(stats.queries, route=route)
+            DB_TIME_PER_REQUEST.observe(stats.db_seconds, route=route)
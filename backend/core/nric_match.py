@@ -0,0 +1,282 @@
+"""
+Resolve a scanned MyKad to a registered patient, tolerating OCR errors.
+
+The NRIC read by OCR is often slightly wrong: a letter instead of a digit
+(O/0, I/1, S/5, B/8), a digit misread as another, or a digit dropped so only
+10 or 11 are left. Instead of an exact lookup, which then just fails:
+
+  1. every NRIC-like token in the raw OCR text is read with the confusable
+     letters mapped to digits (nric_readings)
+  2. a reading that is exactly a registered NRIC wins
+  3. otherwise the block index below supplies every patient within MAX_EDITS
+     edits (wrong, missing or extra digits) of a reading, ranked by edit
+     distance, then by how close the OCR name is to theirs
+
+Only an exact match returns a profile; anything else comes back as candidates
+for the user to pick from, so a misread never silently opens the wrong record.
+An exact reading is looked up on its own shard only, near matches on every
+shard (see sharding.py).
+
+Block index: a 12-digit NRIC is cut into 4 blocks of 3 digits, and every pair
+of blocks (6 pairs) is stored as one integer key in nric_match_keys:
+
+    key = pair number * 1_000_000 + the pair's 6 digits
+
+Two wrong digits touch at most 2 blocks, so at least one pair of blocks is read
+correctly and its key finds the patient with an index lookup. Missing digits
+are tried as a wildcard at every position and extra digits are dropped at every
+position (both, for a 12-digit reading that lost one digit and gained another);
+a block holding a wildcard is just treated as touched. Triggers on `patients` keep the keys in sync, like the
+patient_search table.
+"""
+import re
+from difflib import SequenceMatcher
+from itertools import combinations
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.core import patient_logic, sharding
+from backend.core.ocrmodule import extract_name
+
+MAX_EDITS = 2
+MAX_CANDIDATES = 5
+
+# letters OCR produces in place of the digit they look like
+CONFUSABLE = {"O": "0", "o": "0", "I": "1", "l": "1", "|": "1", "S": "5", "s": "5", "B": "8"}
+_CONFUSABLE_TABLE = str.maketrans(CONFUSABLE)
+
+_CHAR = "[0-9" + re.escape("".join(CONFUSABLE)) + "]"
+# runs of digits / confusable letters, allowing the usual dashes and spaces between them
+_TOKEN = re.compile(rf"{_CHAR}(?:{_CHAR}|[- ](?={_CHAR}))+")
+# a line holding something NRIC-sized, for finding the name line below a misread NRIC
+_NRIC_LINE = rf"{_CHAR}(?:[- ]?{_CHAR}){{9,}}"
+
+BLOCK = 3
+PAIRS = list(combinations(range(4), 2))  # (0, 1), (0, 2) ... (2, 3)
+
+# one row per block pair: (pair number, 1-based start of the first block, of the second block)
+_PAIRS_SQL = " UNION ALL ".join(
+    f"SELECT {n} AS n, {a * BLOCK + 1} AS a, {b * BLOCK + 1} AS b" for n, (a, b) in enumerate(PAIRS)
+)
+
+
+def _keys_select(nric_sql: str, id_sql: str, source: str = ""):
+    """SELECT of (key, patient_id) for every block pair of a 12-digit NRIC"""
+    return f"""
+        SELECT pairs.n * 1000000 + CAST(substr(d.v, pairs.a, 3) || substr(d.v, pairs.b, 3) AS INTEGER) AS key, d.id AS patient_id
+        FROM (SELECT {patient_logic.NRIC_DIGITS_SQL.format(nric_sql)} AS v, {id_sql} AS id {source}) d, ({_PAIRS_SQL}) pairs
+        WHERE length(d.v) = 12 AND d.v NOT GLOB '*[^0-9]*'
+    """
+
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS nric_match_keys (key INTEGER NOT NULL, patient_id INTEGER NOT NULL, PRIMARY KEY (key, patient_id)) WITHOUT ROWID",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS nric_match_keys_insert AFTER INSERT ON patients BEGIN
+        INSERT INTO nric_match_keys(key, patient_id) {_keys_select('new.nric_number', 'new.id')};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS nric_match_keys_update AFTER UPDATE OF nric_number ON patients BEGIN
+        DELETE FROM nric_match_keys WHERE patient_id = old.id AND key IN (
+            SELECT key FROM ({_keys_select('old.nric_number', 'old.id')})
+        );
+        INSERT INTO nric_match_keys(key, patient_id) {_keys_select('new.nric_number', 'new.id')};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS nric_match_keys_delete AFTER DELETE ON patients BEGIN
+        DELETE FROM nric_match_keys WHERE patient_id = old.id AND key IN (
+            SELECT key FROM ({_keys_select('old.nric_number', 'old.id')})
+        );
+    END
+    """,
+]
+
+
+""" INDEX MAINTENANCE """
+
+def install_match_index(engine):
+    """Create the key table and triggers; rebuild the keys if they don't match `patients`"""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.exec_driver_sql(statement)
+
+        indexed = conn.exec_driver_sql("SELECT count(*) FROM nric_match_keys").scalar()
+        expected = len(PAIRS) * conn.exec_driver_sql(
+            f"SELECT count(*) FROM patients WHERE length({patient_logic.NRIC_DIGITS_SQL.format('nric_number')}) = 12"
+            f" AND {patient_logic.NRIC_DIGITS_SQL.format('nric_number')} NOT GLOB '*[^0-9]*'"
+        ).scalar()
+        if indexed != expected:
+            rebuild_match_index(conn)
+
+
+def rebuild_match_index(conn):
+    conn.exec_driver_sql("DELETE FROM nric_match_keys")
+    conn.exec_driver_sql(
+        "INSERT INTO nric_match_keys(key, patient_id) "
+        + _keys_select("nric_number", "id", "FROM patients")
+    )
+
+
+""" READING THE SCAN """
+
+def nric_readings(raw_ocr: str):
+    """Digit strings (10 to 13 digits) that could be the NRIC, the most digit-like first"""
+    readings = []
+    for token in _TOKEN.findall(raw_ocr or ""):
+        compact = re.sub(r"[- ]", "", token)
+        # mostly letters is a word like "SOS", not a misread number
+        real_digits = sum(c.isdigit() for c in compact)
+        if not 10 <= len(compact) <= 13 or real_digits < 6:
+            continue
+        digits = compact.translate(_CONFUSABLE_TABLE)
+        if digits not in (r for _, r in readings):
+            readings.append((real_digits, digits))
+    readings.sort(key=lambda r: -r[0])
+    return [digits for _, digits in readings]
+
+
+def edit_distance(a: str, b: str, limit: int):
+    """Levenshtein distance, or limit + 1 as soon as it must exceed `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def name_similarity(ocr_name, full_name):
+    if not ocr_name or not full_name:
+        return None
+    return round(SequenceMatcher(None, " ".join(ocr_name.upper().split()), " ".join(full_name.upper().split())).ratio(), 3)
+
+
+""" LOOKUP """
+
+def _aligned_variants(digits: str, max_edits: int):
+    """12-character patterns the reading could stand for ("?" = a digit OCR missed).
+    Extra digits (a stray mark taken for a 1) are dropped and missing ones put back
+    as "?", in every combination of at most max_edits such edits: a 12-digit reading
+    may also have lost one digit and gained another"""
+    variants = set()
+    for extra in range(max_edits + 1):
+        missing = 12 - (len(digits) - extra)
+        if missing < 0 or extra + missing > max_edits:
+            continue
+        for kept in combinations(digits, len(digits) - extra):
+            for positions in combinations(range(12), missing):
+                chars, source = [], iter(kept)
+                for i in range(12):
+                    chars.append("?" if i in positions else next(source))
+                variants.add("".join(chars))
+    return variants
+
+
+def match_keys(digits: str, max_edits: int = MAX_EDITS):
+    """Block-pair keys that must contain any NRIC within max_edits of the reading"""
+    keys = set()
+    for pattern in _aligned_variants(digits, max_edits):
+        blocks = [pattern[i * BLOCK:(i + 1) * BLOCK] for i in range(4)]
+        for n, (a, b) in enumerate(PAIRS):
+            if "?" not in blocks[a] and "?" not in blocks[b]:
+                keys.add(n * 1_000_000 + int(blocks[a] + blocks[b]))
+    return keys
+
+
+def _exact_patient(db: Session, digits: str):
+    # the stored NRIC may or may not have dashes
+    formatted = f"{digits[:6]}-{digits[6:8]}-{digits[8:]}"
+    return (
+        db.query(patient_logic.Patient)
+        .filter(patient_logic.Patient.nric_number.in_([digits, formatted]))
+        .first()
+    )
+
+
+def near_matches(db: Session, keys, readings, ocr_name=None, max_edits: int = MAX_EDITS, limit: int = MAX_CANDIDATES):
+    """Patients within max_edits of a reading, found through their block-pair keys, best first"""
+    key_list = sorted(keys)
+    placeholders = ", ".join(f":k{i}" for i in range(len(key_list)))
+    candidate_ids = db.execute(
+        text(f"SELECT DISTINCT patient_id FROM nric_match_keys WHERE key IN ({placeholders})"),
+        {f"k{i}": key for i, key in enumerate(key_list)},
+    ).scalars().all()
+    if not candidate_ids:
+        return []
+
+    candidates = []
+    for patient in db.query(patient_logic.Patient).filter(patient_logic.Patient.id.in_(candidate_ids)):
+        nric_digits = re.sub(r"\D", "", patient.nric_number)
+        edits = min(edit_distance(digits, nric_digits, max_edits) for digits in readings)
+        if edits > max_edits:
+            continue
+        candidates.append({
+            "user_id": str(patient.id),
+            "full_name": patient.full_name,
+            "nric_number": patient.nric_number,
+            "birth_date": patient.birth_date,
+            "sex": patient.sex,
+            "edits": edits,
+            "name_similarity": name_similarity(ocr_name, patient.full_name),
+        })
+
+    candidates.sort(key=_candidate_order)
+    return candidates[:limit]
+
+
+def _candidate_order(candidate):
+    return candidate["edits"], -(candidate["name_similarity"] or 0), int(candidate["user_id"])
+
+
+def resolve_nric(readings, serialize, ocr_name=None, max_edits: int = MAX_EDITS, limit: int = MAX_CANDIDATES):
+    """(patient id, profile, candidates): the `serialize`d patient on an exact match, otherwise ranked near matches"""
+    for digits in readings:
+        if len(digits) == 12:
+            # an exact NRIC can only be on its own shard
+            with sharding.patient_session(digits) as db:
+                patient = _exact_patient(db, digits)
+                if patient:
+                    return patient.id, serialize(patient), []
+
+    keys = set()
+    for digits in readings:
+        keys |= match_keys(digits, max_edits)
+    if not keys:
+        return None, None, []
+
+    # a near match could be on any shard
+    candidates = [c for page in sharding.fan_out(near_matches, keys, readings, ocr_name, max_edits, limit) for c in page]
+    candidates.sort(key=_candidate_order)
+    return None, None, candidates[:limit]
+
+
+def lookup_scan(scan: dict, serialize):
+    """Response for a fused scan + lookup; `serialize` turns the matched patient into the caller's profile shape"""
+    readings = nric_readings(scan.get("raw_ocr"))
+    if not readings and scan.get("nric"):
+        readings = [re.sub(r"\D", "", scan["nric"])]
+
+    name = scan.get("name")
+    if not name and scan.get("raw_ocr"):
+        # extract_name looks below a clean NRIC line; let it start from a misread one too
+        name = extract_name(scan["raw_ocr"], _NRIC_LINE)
+
+    patient_id, profile, candidates = resolve_nric(readings, serialize, name)
+    return {
+        "scan": {"nric": scan.get("nric"), "name": name, "partial": scan.get("partial", False), "confidence": scan.get("confidence")},
+        "match": "exact" if patient_id is not None else ("near" if candidates else "none"),
+        # for the caller (audit), not part of the response models
+        "patient_id": patient_id,
+        "profile": profile,
+        "candidates": candidates,
+    }
@@ -0,0 +1,220 @@
+"""
+Asynchronous OCR jobs.
+
+Instead of holding the HTTP connection open for the whole OCR run, a client
+submits the image, gets a job id back immediately and then either polls the job
+or listens on its server-sent events stream. The job waits for an OCR slot
+(see admission.py) and runs on the OCR thread pool like any other scan.
+
+Finished jobs are kept for OCR_JOB_TTL seconds (default 600). At most
+OCR_MAX_PENDING_JOBS jobs may be queued or running per worker (default 32);
+beyond that submissions get a 429. Jobs live in worker memory, so a client must
+come back to the same worker (fine for a single uvicorn process).
+"""
+import asyncio
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+
+from fastapi import HTTPException, Request, UploadFile, status
+from fastapi.responses import StreamingResponse
+
+from backend.core import audit
+from backend.core.admission import ocr_slot, client_key, OCR_REJECTIONS, _too_many_requests
+from backend.core.metrics import Counter, Gauge, Histogram, OCR_BUCKETS
+from backend.core.ocrmodule import read_mykad_upload, run_ocr_in_pool
+
+OCR_JOB_TTL = float(os.getenv("OCR_JOB_TTL", "600"))
+OCR_MAX_PENDING_JOBS = int(os.getenv("OCR_MAX_PENDING_JOBS", "32"))
+
+# seconds between keep-alive comments on an idle event stream
+EVENT_KEEPALIVE = 15
+
+OCR_JOB_QUEUE_TIME = Histogram("ocr_job_queue_seconds", "Time OCR jobs waited before running", buckets=OCR_BUCKETS)
+OCR_JOB_RUN_TIME = Histogram("ocr_job_run_seconds", "Time OCR jobs spent running", buckets=OCR_BUCKETS)
+OCR_JOBS_FINISHED = Counter("ocr_jobs_total", "Finished OCR jobs", ["status"])
+
+
+class OcrJob:
+    __slots__ = ("id", "owner", "audit_context", "status", "created_at", "started_at", "finished_at", "result", "error", "_changed")
+
+    def __init__(self, owner: str, audit_context=None):
+        self.id = secrets.token_urlsafe(16)
+        self.owner = owner
+        # who submitted it, for the audit event written when the scan finishes
+        self.audit_context = audit_context
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    @property
+    def queue_seconds(self):
+        end = self.started_at or self.finished_at or time.time()
+        return end - self.created_at
+
+    @property
+    def run_seconds(self):
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def _set_status(self, status: str):
+        self.status = status
+        # wake every waiter, then start a fresh event for the next change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "queue_seconds": round(self.queue_seconds, 4),
+            "run_seconds": round(self.run_seconds, 4) if self.run_seconds is not None else None,
+        }
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class OcrJobStore:
+    def __init__(self, ttl: float, max_pending: int):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        # jobs are added on the event loop but read from threadpool routes and the
+        # /metrics gauge, so every access to _jobs holds the lock
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # keep references so running tasks aren't garbage collected
+        self._tasks = set()
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._jobs.items())
+
+    def pending(self):
+        return sum(1 for _, job in self._snapshot() if not job.finished)
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._snapshot() if job.finished and job.finished_at < cutoff]
+        with self._lock:
+            for job_id in expired:
+                self._jobs.pop(job_id, None)
+
+    def submit(self, image_bytes: bytes, owner: str, audit_context=None):
+        self._purge_expired()
+        if self.pending() >= self.max_pending:
+            OCR_REJECTIONS.inc(reason="job_queue_full")
+            raise _too_many_requests("OCR service is busy, please try again shortly", 5)
+
+        job = OcrJob(owner, audit_context)
+        with self._lock:
+            self._jobs[job.id] = job
+        # run in a fresh context: the job outlives the request that submitted it
+        task = contextvars.Context().run(asyncio.create_task, self._run(job, image_bytes))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str, owner: str):
+        self._purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        # other clients' jobs are reported as missing rather than forbidden
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    async def _run(self, job: OcrJob, image_bytes: bytes):
+        try:
+            async with ocr_slot(bounded=False):
+                job.started_at = time.time()
+                job._set_status("running")
+                job.result = await run_ocr_in_pool(image_bytes)
+            job.finished_at = time.time()
+            job._set_status("done")
+            audit.record("mykad_scan", context=job.audit_context, nric=job.result["nric"], raw_ocr=job.result["raw_ocr"], job_id=job.id)
+        except HTTPException as e:
+            job.error = {"status_code": e.status_code, "detail": e.detail}
+            job.finished_at = time.time()
+            job._set_status("failed")
+        except Exception as e:
+            job.error = {"status_code": 500, "detail": f"Error processing image: {str(e)}"}
+            job.finished_at = time.time()
+            job._set_status("failed")
+        finally:
+            OCR_JOB_QUEUE_TIME.observe(job.queue_seconds)
+            if job.run_seconds is not None:
+                OCR_JOB_RUN_TIME.observe(job.run_seconds)
+            OCR_JOBS_FINISHED.inc(status=job.status)
+
+
+JOBS = OcrJobStore(OCR_JOB_TTL, OCR_MAX_PENDING_JOBS)
+
+OCR_JOBS_PENDING = Gauge("ocr_jobs_pending", "OCR jobs queued or running", function=JOBS.pending)
+
+
+""" ROUTE HELPERS """
+
+async def submit_job(file: UploadFile, request: Request, session=None):
+    """Queue an uploaded MyKad image; returns the job plus where to poll / listen"""
+    image_bytes = await read_mykad_upload(file)
+    job = JOBS.submit(image_bytes, client_key(request), audit.request_context(request, session))
+
+    base = str(request.url.path).rstrip("/")
+    if base.endswith("/jobs"):
+        base = base[: -len("/jobs")]
+    return {
+        **job.to_dict(),
+        "status_url": f"{base}/jobs/{job.id}",
+        "events_url": f"{base}/jobs/{job.id}/events",
+    }
+
+
+def _get_job_or_404(job_id: str, request: Request):
+    job = JOBS.get(job_id, client_key(request))
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found or expired")
+    return job
+
+
+def job_status(job_id: str, request: Request):
+    return _get_job_or_404(job_id, request).to_dict()
+
+
+def job_events(job_id: str, request: Request):
+    """Server-sent events: a `status` event per change, ending with `done` or `failed`"""
+    job = _get_job_or_404(job_id, request)
+
+    async def stream():
+        while True:
+            changed = job._changed
+            yield f"event: {job.status}\ndata: {json.dumps(job.to_dict(), default=str)}\n\n"
+            if job.finished:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=EVENT_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                if await request.is_disconnected():
+                    return
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
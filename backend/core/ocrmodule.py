@@ -1,21 +1,58 @@
 import re
 import os
 import sys
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
 from fastapi import FastAPI, UploadFile, File, HTTPException
+from backend.core.metrics import Counter, ocr_stage
+from backend.core.logs import get_logger
+from backend.core.admission import ocr_slot, OCR_MAX_CONCURRENCY
+from backend.core.profiling import attach_current_thread
+
+log = get_logger("ocr")
+
+# seconds one scan may spend in preprocessing and Tesseract, once it has an OCR slot
+OCR_DEADLINE = float(os.getenv("OCR_DEADLINE", "10"))
+# share of the deadline preprocessing may use before skipping its optional steps
+OCR_PREPROCESS_SHARE = float(os.getenv("OCR_PREPROCESS_SHARE", "0.2"))
+
+# (stage, Tesseract config, weight), tried in order until one produces text. Each attempt
+# may use the time left except a reserve for the fallback pass, the fallback's weight
+# against the weights of the attempts not run yet; later attempts share what it leaves
+OCR_ATTEMPTS = [
+    ("psm_6", "--psm 6", 3),    # Assume uniform block of text
+    ("psm_7", "--psm 7", 1),    # Treat image as single text line
+    ("psm_8", "--psm 8", 1),    # Treat image as single word
+    ("psm_11", "--psm 11", 2),  # Sparse text
+    ("default", "", 1),         # Default
+]
+# the last-resort lang='eng' pass, only run when no attempt produced any text
+OCR_FALLBACK_WEIGHT = 1
+
+OCR_PARTIAL_RESULTS = Counter(
+    "ocr_partial_results_total", "Scans answered with a partial result because OCR_DEADLINE ran out", ["stage"]
+)
+
+# Pillow and pytesseract are imported inside the functions that use them so that
+# importing this module (and every router that uses it) stays cheap. The OCR
+# stack is only loaded by the first scan, or by load_ocr() when preloading.
 
 # Auto-detect Tesseract installation on Windows/Linux
 def configure_tesseract():
     """Automatically configure Tesseract path if not in system PATH"""
+    import pytesseract
+
     # First, check if tesseract is already accessible (e.g., in PATH on Linux)
     try:
         version = pytesseract.get_tesseract_version()
-        print(f"Tesseract found in PATH: version {version}")
+        log.info("tesseract found in PATH", extra={"fields": {"version": str(version)}})
         return True
     except Exception as e:
-        print(f"Tesseract not found in PATH: {e}")
+        log.info("tesseract not found in PATH", extra={"fields": {"error": str(e)}})
         pass  # Not found, try common paths
     
     # Platform-specific paths
@@ -32,11 +69,11 @@ def configure_tesseract():
         import shutil
         tesseract_path = shutil.which('tesseract')
         if tesseract_path:
-            print(f"Found tesseract via which: {tesseract_path}")
+            log.info("found tesseract via which", extra={"fields": {"path": tesseract_path}})
             pytesseract.pytesseract.tesseract_cmd = tesseract_path
             try:
                 version = pytesseract.get_tesseract_version()
-                print(f"Tesseract configured: version {version}")
+                log.info("tesseract configured", extra={"fields": {"path": tesseract_path, "version": str(version)}})
                 return True
             except Exception:
                 pass
@@ -50,37 +87,64 @@ def configure_tesseract():
     # Try common installation paths
     for path in common_paths:
         if os.path.exists(path):
-            print(f"Trying tesseract path: {path}")
+            log.info("trying tesseract path", extra={"fields": {"path": path}})
             pytesseract.pytesseract.tesseract_cmd = path
             try:
                 version = pytesseract.get_tesseract_version()
-                print(f"Tesseract configured successfully: {path}, version {version}")
+                log.info("tesseract configured", extra={"fields": {"path": path, "version": str(version)}})
                 return True
             except Exception as e:
-                print(f"Failed to use {path}: {e}")
+                log.warning("failed to use tesseract path", extra={"fields": {"path": path, "error": str(e)}})
                 continue  # Try next path
     
     # If we get here, Tesseract is not found
-    print("WARNING: Tesseract not found in common paths. OCR may not work.")
+    log.warning("tesseract not found in common paths, OCR will not work")
     return False
 
-# Configure Tesseract on module import
-tesseract_configured = configure_tesseract()
+# Tesseract is configured once per process, on first use instead of on module import
+tesseract_configured = None
+_ocr_load_lock = threading.Lock()
 
-# Manual configuration fallback (mainly for Windows)
-if not hasattr(pytesseract.pytesseract, 'tesseract_cmd') or not pytesseract.pytesseract.tesseract_cmd:
-    if sys.platform.startswith('win'):
-        default_path = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-        if os.path.exists(default_path):
-            pytesseract.pytesseract.tesseract_cmd = default_path
-            print(f"Using Windows default path: {default_path}")
-    # On Linux, if still not configured, try one more time with which
-    else:
-        import shutil
-        tesseract_path = shutil.which('tesseract')
-        if tesseract_path and not pytesseract.pytesseract.tesseract_cmd:
-            pytesseract.pytesseract.tesseract_cmd = tesseract_path
-            print(f"Using tesseract from PATH: {tesseract_path}")
+def load_ocr():
+    """Import Pillow/pytesseract and locate Tesseract, once per process. Returns True if Tesseract is usable"""
+    global tesseract_configured
+    if tesseract_configured is None:
+        with _ocr_load_lock:
+            if tesseract_configured is None:
+                import PIL.Image  # noqa: F401
+                tesseract_configured = configure_tesseract()
+    return tesseract_configured
+
+""" DEADLINE """
+
+class OcrDeadline:
+    """Time budget of one scan, shared out between preprocessing and the OCR attempts"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.expires = self.started + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def preprocess_left(self):
+        """Seconds left of preprocessing's share"""
+        return self.started + self.seconds * OCR_PREPROCESS_SHARE - time.monotonic()
+
+    def attempt_timeout(self, attempt: int, fallback: bool = True):
+        """Tesseract timeout for OCR_ATTEMPTS[attempt] (len(OCR_ATTEMPTS): the fallback pass): all the
+        time left, minus a reserve for the fallback pass if it may still be needed"""
+        remaining = self.remaining()
+        if fallback and attempt < len(OCR_ATTEMPTS):
+            weights = sum(weight for _, _, weight in OCR_ATTEMPTS[attempt:]) + OCR_FALLBACK_WEIGHT
+            remaining -= remaining * OCR_FALLBACK_WEIGHT / weights
+        # pytesseract treats 0 as no timeout
+        return max(0.01, remaining)
 
 """ HELPER FUNCTIONS """
 
@@ -128,14 +192,14 @@ def extract_nric(text: str):
     return None
 
 
-def extract_name(text: str):
+def extract_name(text: str, nric_pattern: str = r'\d{6}[- ]?\d{2}[- ]?\d{4}'):
     lines = [line.strip() for line in text.splitlines() if line.strip()]
     lines_upper = [line.upper() for line in lines]
 
     # Step 1: Find NRIC line index
     nric_index = None
     for i, line in enumerate(lines_upper):
-        if re.search(r'\d{6}[- ]?\d{2}[- ]?\d{4}', line):
+        if re.search(nric_pattern, line):
             nric_index = i
             break
 
@@ -165,26 +229,50 @@ def extract_name(text: str):
 """ IMAGE PROCESSING OCR """
 
 # image selection + processing
-def process_image_bytes(image_bytes: bytes):
+def process_image_bytes(image_bytes: bytes, deadline: OcrDeadline | None = None):
     """Process image for better OCR accuracy"""
-    img = Image.open(BytesIO(image_bytes))
-    
-    # Convert to RGB if necessary (PIL requires RGB for some operations)
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
+    from PIL import Image
+
+    with ocr_stage("decode"):
+        img = Image.open(BytesIO(image_bytes))
+        
+        # Convert to RGB if necessary (PIL requires RGB for some operations)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
     
-    print(f"Opened image: {img.format}, Size: {img.size}, Mode: {img.mode}")
+    log.debug("image opened", extra={"fields": {"format": img.format, "size": img.size, "mode": img.mode}, "verbose": True})
+
+    with ocr_stage("preprocess"):
+        return _preprocess_image(img, deadline)
+
+
+def _preprocess_image(img, deadline: OcrDeadline | None = None):
+    """Grayscale, contrast, sharpen, upscale and denoise a decoded image.
+    With a deadline, the steps after grayscale are skipped once preprocessing's share of it is used up"""
+    from PIL import Image, ImageEnhance, ImageFilter
+
+    def out_of_time(step):
+        if deadline is None or deadline.preprocess_left() > 0:
+            return False
+        log.info("preprocessing cut short", extra={"fields": {"skipped_from": step}})
+        return True
 
     # Convert to grayscale for better OCR
     img = img.convert('L')  # Convert to grayscale
+    if out_of_time("contrast"):
+        return img
     
     # Enhance contrast
     enhancer = ImageEnhance.Contrast(img)
     img = enhancer.enhance(1.5)  # Increase contrast by 50%
+    if out_of_time("sharpen"):
+        return img
     
     # Enhance sharpness
     enhancer = ImageEnhance.Sharpness(img)
     img = enhancer.enhance(2.0)  # Increase sharpness
+    if out_of_time("upscale"):
+        return img
     
     # Resize if image is too small (OCR works better with larger images)
     width, height = img.size
@@ -194,29 +282,43 @@ def process_image_bytes(image_bytes: bytes):
         new_width = int(width * scale)
         new_height = int(height * scale)
         img = img.resize((new_width, new_height), Image.LANCZOS)
-        print(f"Resized image to: {new_width}x{new_height} for better OCR")
+        log.debug("image upscaled for OCR", extra={"fields": {"size": (new_width, new_height)}, "verbose": True})
     
+    if out_of_time("denoise"):
+        return img
+
     # Apply slight denoising
     img = img.filter(ImageFilter.MedianFilter(size=3))
     
     return img
 
 
-# USE THIS ONLY
-async def ocr_mykad_image(file: UploadFile = File(...)):
-    try:
-        content_type = file.content_type
+def reading_confidence(text: str, nric, name):
+    """0-1, how complete and clean a reading is: the NRIC counts 0.6 (0.3 if digits were
+    missing and had to be padded), the name 0.4"""
+    confidence = 0.0
+    if nric:
+        digits = re.sub(r'\D', '', nric)
+        confidence += 0.6 if digits in re.sub(r'[\s-]', '', text) else 0.3
+    if name:
+        confidence += 0.4
+    return round(confidence, 2)
+
 
-        if not content_type or not content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="Invalid file type")
+def read_fields(text: str):
+    """(nric, name, confidence) for one OCR attempt's text"""
+    nric = extract_nric(text)
+    name = extract_name(text)
+    return nric, name, reading_confidence(text, nric, name)
 
-        image_bytes = await file.read()
-        processed_image = process_image_bytes(image_bytes)
 
+def ocr_mykad_bytes(image_bytes: bytes):
+    """Blocking OCR of one image: Tesseract check, preprocessing, PSM attempts and field extraction,
+    all within OCR_DEADLINE seconds. Runs on the OCR thread pool, see run_ocr_in_pool"""
+    with attach_current_thread():
         # Check if Tesseract is accessible before attempting OCR
-        try:
-            pytesseract.get_tesseract_version()
-        except Exception as e:
+        # (probed once per process by load_ocr, not on every request)
+        if not load_ocr():
             error_msg = (
                 "Tesseract OCR is not installed or not found.\n\n"
                 "Please install Tesseract OCR:\n"
@@ -224,68 +326,126 @@ async def ocr_mykad_image(file: UploadFile = File(...)):
                 "2. Install and check 'Add to PATH' during installation\n"
                 "3. Restart your terminal and server\n\n"
                 "OR manually configure the path in backend/core/ocrmodule.py:\n"
-                "pytesseract.pytesseract.tesseract_cmd = r'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'\n\n"
-                f"Error: {str(e)}"
+                "pytesseract.pytesseract.tesseract_cmd = r'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'"
             )
             raise HTTPException(status_code=500, detail=error_msg)
-        
-        # Perform OCR with multiple configurations for better accuracy
-        ocr_text = None
+
+        import pytesseract
+
+        deadline = OcrDeadline(OCR_DEADLINE)
+        processed_image = process_image_bytes(image_bytes, deadline)
+
+        # best reading so far: (confidence, nric, name, text)
+        best = None
         ocr_errors = []
-        
-        # Try different OCR configurations
-        configs = [
-            '--psm 6',  # Assume uniform block of text
-            '--psm 7',  # Treat image as single text line
-            '--psm 8',  # Treat image as single word
-            '--psm 11', # Sparse text
-            '',  # Default
-        ]
-        
-        for config in configs:
+        # the stage running when the deadline ran out, if it does
+        last_stage = "preprocess"
+
+        # Try different OCR configurations until one produces text
+        for i, (stage, config, _) in enumerate(OCR_ATTEMPTS):
+            if deadline.expired:
+                break
+            last_stage = stage
             try:
-                if config:
-                    ocr_text = pytesseract.image_to_string(processed_image, config=config)
-                else:
-                    ocr_text = pytesseract.image_to_string(processed_image)
-                
-                # If we got some text, use it
-                if ocr_text and len(ocr_text.strip()) > 0:
-                    print(f"OCR successful with config: {config if config else 'default'}")
-                    break
+                # one timing series per attempt, e.g. psm_6, psm_11, default
+                with ocr_stage(stage):
+                    ocr_text = pytesseract.image_to_string(processed_image, config=config, timeout=deadline.attempt_timeout(i, fallback=best is None))
             except Exception as e:
+                # includes Tesseract being killed at its timeout
                 ocr_errors.append(f"Config '{config}': {str(e)}")
                 continue
-        
+
+            if ocr_text and len(ocr_text.strip()) > 0:
+                with ocr_stage("extraction"):
+                    nric, name, confidence = read_fields(ocr_text)
+                log.debug("ocr attempt produced text", extra={"fields": {"config": config or "default", "confidence": confidence}, "verbose": True})
+                best = (confidence, nric, name, ocr_text)
+                break
+
         # If all configs failed, try one more time with default
-        if not ocr_text or len(ocr_text.strip()) == 0:
+        if best is None and not deadline.expired:
+            last_stage = "default_eng"
             try:
-                ocr_text = pytesseract.image_to_string(processed_image, lang='eng')
+                with ocr_stage("default_eng"):
+                    ocr_text = pytesseract.image_to_string(processed_image, lang='eng', timeout=deadline.attempt_timeout(len(OCR_ATTEMPTS)))
+                if ocr_text and len(ocr_text.strip()) > 0:
+                    with ocr_stage("extraction"):
+                        nric, name, confidence = read_fields(ocr_text)
+                    best = (confidence, nric, name, ocr_text)
             except Exception as e:
                 ocr_errors.append(f"Default with lang='eng': {str(e)}")
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"OCR processing failed. Errors: {'; '.join(ocr_errors)}"
-                )
-        
-        if not ocr_text or len(ocr_text.strip()) == 0:
+                if not deadline.expired:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"OCR processing failed. Errors: {'; '.join(ocr_errors)}"
+                    )
+
+        # out of time before a full reading: answer with what we have instead of failing
+        partial = deadline.expired and not (best and best[1] and best[2])
+        if partial:
+            OCR_PARTIAL_RESULTS.inc(stage=last_stage)
+            log.warning("ocr deadline exceeded", extra={"fields": {
+                "deadline_s": OCR_DEADLINE,
+                "stage": last_stage,
+                "nric_found": bool(best and best[1]),
+                "name_found": bool(best and best[2]),
+            }})
+        elif best is None:
             raise HTTPException(
                 status_code=500,
                 detail="OCR did not extract any text from the image. Please ensure the image is clear and readable."
             )
-        
-        print(f"OCR extracted text (first 200 chars): {ocr_text[:200]}")
-        
-        nric = extract_nric(ocr_text)
-        name = extract_name(ocr_text)
-        
-        print(f"Extracted NRIC: {nric}, Name: {name}")
+
+        confidence, nric, name, ocr_text = best or (0.0, None, None, "")
+
+        log.info("mykad scanned", extra={"fields": {
+            "nric": nric,
+            "name": name,
+            "nric_found": nric is not None,
+            "name_found": name is not None,
+            "ocr_chars": len(ocr_text),
+            "confidence": confidence,
+            "partial": partial,
+        }})
 
         return {
             "nric": nric,
             "name": name,
-            "raw_ocr": ocr_text
+            "raw_ocr": ocr_text,
+            "partial": partial,
+            "confidence": confidence,
         }
+
+
+# OCR never runs on the event loop, so a slow scan can't stall other requests.
+# Tesseract runs as a subprocess and Pillow releases the GIL, so threads give real parallelism.
+_ocr_pool = ThreadPoolExecutor(max_workers=OCR_MAX_CONCURRENCY, thread_name_prefix="ocr")
+
+async def run_ocr_in_pool(image_bytes: bytes):
+    """Run ocr_mykad_bytes on the OCR pool, keeping the request's context (metrics, profiling)"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_ocr_pool, context.run, ocr_mykad_bytes, image_bytes)
+
+
+async def read_mykad_upload(file: UploadFile):
+    """Validate the upload's content type and return its bytes"""
+    content_type = file.content_type
+
+    if not content_type or not content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Invalid file type")
+
+    return await file.read()
+
+
+# USE THIS ONLY
+async def ocr_mykad_image(file: UploadFile = File(...)):
+    try:
+        image_bytes = await read_mykad_upload(file)
+
+        # wait for one of the global OCR slots (429 when saturated), then run off the event loop
+        async with ocr_slot():
+            return await run_ocr_in_pool(image_bytes)
     except HTTPException:
         # Re-raise HTTP exceptions as-is
         raise
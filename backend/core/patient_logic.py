@@ -1,8 +1,9 @@
 # external imports
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, load_only, selectinload
 from sqlalchemy import String, Date, ForeignKey, JSON
 from typing import List, Optional
 from pydantic import BaseModel, Field
+from fastapi import HTTPException, status
 from datetime import datetime, date, timedelta
 
 # local imports
@@ -17,7 +18,7 @@ class PreviousMajorSurgeries(Base):
     __tablename__ = "previous_major_surgeries"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False)
+    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False, index=True)
 
     surgery_name: Mapped[str] = mapped_column(String, nullable=False)
     date: Mapped[Date] = mapped_column(Date, nullable=False)
@@ -29,7 +30,7 @@ class MedicationPrescription(Base):
     __tablename__ = "medication_prescriptions"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False)
+    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False, index=True)
 
     prescription_name: Mapped[str] = mapped_column(String, nullable=False)
     prescription_dose: Mapped[str] = mapped_column(String, nullable=False)
@@ -42,7 +43,7 @@ class Immunization(Base):
     __tablename__ = "immunizations"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False)
+    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False, index=True)
 
     immunization_name: Mapped[str] = mapped_column(String, nullable=False)
     date: Mapped[Date] = mapped_column(Date, nullable=False)
@@ -54,7 +55,7 @@ class PresentingComplaint(Base):
     __tablename__ = "presenting_complaints"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False)
+    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False, index=True)
 
     complaint: Mapped[str] = mapped_column(String, nullable=False)
     date: Mapped[Date] = mapped_column(Date, nullable=False)
@@ -66,7 +67,7 @@ class EmergencyContact(Base):
     __tablename__ = "emergency_contacts"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False)
+    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), nullable=False, index=True)
 
     name: Mapped[str] = mapped_column(String, nullable=False)
     contact_number: Mapped[str] = mapped_column(String, nullable=False)
@@ -100,6 +101,9 @@ class Patient(Base):
     presenting_complaint: Mapped[List["PresentingComplaint"]] = relationship("PresentingComplaint", back_populates="patient")
     emergency_contacts: Mapped[List["EmergencyContact"]] = relationship("EmergencyContact", back_populates="patient")
 
+# SQL for an NRIC column without its dashes and spaces, e.g. NRIC_DIGITS_SQL.format("nric_number")
+NRIC_DIGITS_SQL = "replace(replace({}, '-', ''), ' ', '')"
+
 # non critical data sending
 
 class PatientRegistrationConfirm(BaseModel):
@@ -112,4 +116,93 @@ class PatientRegistrationConfirm(BaseModel):
     allergies: Optional[List[str]] = None
     chronic_conditions: Optional[List[str]] = None
     risk_factors: Optional[List[str]] = None
-    emergency_contacts: Optional[List[str]] = None
\ No newline at end of file
+    emergency_contacts: Optional[List[str]] = None
+
+
+""" PATIENT DATA RESPONSES """
+
+# shared by every route that returns a patient, shapes match backend/schemas.py
+
+# profile field -> how to serialize one row of that relationship
+PROFILE_RELATIONSHIPS = {
+    "major_surgeries": lambda s: {"surgery_name": s.surgery_name, "date": s.date, "additional_info": s.additional_info},
+    "prescriptions": lambda p: {"prescription_name": p.prescription_name, "prescription_dose": p.prescription_dose, "date": p.date, "additional_info": p.additional_info},
+    "immunization": lambda i: {"immunization_name": i.immunization_name, "date": i.date, "additional_info": i.additional_info},
+    "presenting_complaint": lambda c: {"complaint": c.complaint, "date": c.date, "additional_info": c.additional_info},
+    "emergency_contacts": lambda e: {"name": e.name, "contact_number": e.contact_number, "address": e.address, "date_added": e.date_added, "additional_info": e.additional_info},
+}
+# profile fields that are plain columns of `patients`
+PROFILE_COLUMNS = [
+    "full_name", "birth_date", "nric_number", "sex", "blood_type",
+    "allergies", "chronic_conditions", "risk_factors", "advanced_directives",
+]
+PROFILE_FIELDS = PROFILE_COLUMNS + list(PROFILE_RELATIONSHIPS) + ["user_id"]
+
+
+def parse_profile_fields(fields: Optional[str]):
+    """`fields=blood_type,allergies` -> list of profile fields, None for the whole profile"""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in PROFILE_FIELDS]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(PROFILE_FIELDS)}",
+        )
+    return list(dict.fromkeys(requested))
+
+
+def load_patient_profile(db, nric: str, fields: Optional[list] = None):
+    """Patient by NRIC with only the columns and relationships `fields` needs loaded (all if None)"""
+    wanted = fields or PROFILE_FIELDS
+    columns = [getattr(Patient, f) for f in PROFILE_COLUMNS if f in wanted]
+    query = db.query(Patient).options(load_only(Patient.nric_number, *columns))
+    for name in PROFILE_RELATIONSHIPS:
+        if name in wanted:
+            # one extra query per requested relationship, none for the rest
+            query = query.options(selectinload(getattr(Patient, name)))
+    return query.filter(Patient.nric_number == nric).first()
+
+
+def patient_profile_data(patient: Patient, fields: Optional[list] = None):
+    """Full profile, schemas.PatientDataResponse; only `fields` when given (schemas.PatientDataPartialResponse)"""
+    data = {}
+    for name in fields or PROFILE_FIELDS:
+        if name == "user_id":
+            data[name] = str(patient.id)
+        elif name in PROFILE_RELATIONSHIPS:
+            data[name] = [PROFILE_RELATIONSHIPS[name](row) for row in getattr(patient, name)]
+        else:
+            data[name] = getattr(patient, name)
+    return data
+
+def clinic_view_data(patient: Patient):
+    """What clinic admins may see, schemas.ClinicPatientViewResponse"""
+    prescriptions = [
+        {
+            "prescription_name": p.prescription_name,
+            "prescription_dose": p.prescription_dose,
+            "date": p.date,
+            "additional_info": p.additional_info,
+        }
+        for p in patient.prescriptions
+    ]
+
+    presenting_complaint = [
+        {
+            "complaint": c.complaint,
+            "date": c.date,
+            "additional_info": c.additional_info,
+        }
+        for c in patient.presenting_complaint
+    ]
+
+    return {
+        "full_name": patient.full_name,
+        "sex": patient.sex,
+        "birth_date": patient.birth_date,
+        "nric_number": patient.nric_number,
+        "prescriptions": prescriptions,
+        "presenting_complaint": presenting_complaint,
+    }
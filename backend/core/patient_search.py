@@ -0,0 +1,275 @@
+"""
+Patient search by (partial) name and (partial) NRIC.
+
+Exact NRIC lookups stay on the unique index of patients.nric_number. For
+everything else there is an SQLite FTS5 table using the trigram tokenizer, so
+any substring of three or more characters is answered from the index instead
+of a LIKE scan over every patient:
+
+    patient_search(rowid = patients.id, full_name, nric)   -- nric is digits only
+
+Triggers on `patients` keep it in sync on every insert, update and delete, so
+registration needs no extra code. `install_search_index` (called from init_db)
+creates the table and triggers and rebuilds the index when it is out of step,
+e.g. the first time it runs against an existing database.
+
+Matching:
+  - digits only (dashes and spaces ignored): NRIC substring. Queries of 6+
+    digits are then followed by NRICs with one digit different, for OCR
+    misreads ("near" matches, see near_nric_candidates)
+  - anything with letters: every word of 3+ letters must appear in full_name
+    (any digits in the query must appear in the NRIC), best bm25 first. Ranking
+    means scoring every match, so very broad queries (RANK_WINDOW matches or
+    more) are returned in registration order instead
+
+Results are paged with an opaque cursor that continues after the last row.
+With SHARD_COUNT > 1 every shard is searched and the pages are merged in the
+same (sort key, id) order; bm25 scores come from each shard's own index.
+"""
+import base64
+import heapq
+import json
+import re
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.core import sharding
+from backend.core.patient_logic import NRIC_DIGITS_SQL
+
+# shortest substring the trigram index can answer
+MIN_TERM_LENGTH = 3
+# digits needed before single-digit-substitution matches are added
+FUZZY_MIN_DIGITS = 6
+# name queries matching this many patients or more aren't ranked
+RANK_WINDOW = 2000
+MAX_LIMIT = 100
+
+SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS patient_search USING fts5(full_name, nric, tokenize='trigram')",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patient_search_insert AFTER INSERT ON patients BEGIN
+        INSERT INTO patient_search(rowid, full_name, nric)
+        VALUES (new.id, new.full_name, {NRIC_DIGITS_SQL.format('new.nric_number')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patient_search_update AFTER UPDATE OF full_name, nric_number ON patients BEGIN
+        DELETE FROM patient_search WHERE rowid = old.id;
+        INSERT INTO patient_search(rowid, full_name, nric)
+        VALUES (new.id, new.full_name, {NRIC_DIGITS_SQL.format('new.nric_number')});
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patient_search_delete AFTER DELETE ON patients BEGIN
+        DELETE FROM patient_search WHERE rowid = old.id;
+    END
+    """,
+]
+
+
+""" INDEX MAINTENANCE """
+
+def install_search_index(engine):
+    """Create the search table and triggers; rebuild the index if it doesn't match `patients`"""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.exec_driver_sql(statement)
+
+        indexed = conn.exec_driver_sql("SELECT count(*) FROM patient_search").scalar()
+        patients = conn.exec_driver_sql("SELECT count(*) FROM patients").scalar()
+        if indexed != patients:
+            rebuild_search_index(conn)
+
+
+def rebuild_search_index(conn):
+    conn.exec_driver_sql("DELETE FROM patient_search")
+    conn.exec_driver_sql(
+        "INSERT INTO patient_search(rowid, full_name, nric) "
+        f"SELECT id, full_name, {NRIC_DIGITS_SQL.format('nric_number')} FROM patients"
+    )
+
+
+""" CURSOR """
+
+def encode_cursor(sort_key, patient_id: int):
+    raw = json.dumps([sort_key, patient_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_key, patient_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (float(sort_key) if sort_key is not None else None), int(patient_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+""" QUERY """
+
+_COLUMNS = "p.id, p.full_name, p.nric_number, p.birth_date, p.sex"
+
+
+def _phrase(term: str):
+    # FTS5 string literal, double quotes are escaped by doubling
+    return '"' + term.replace('"', '""') + '"'
+
+
+def parse_query(q: str):
+    """Split a search string into name words and NRIC digit groups, dropping too-short pieces"""
+    words = [w for w in re.findall(r"[^\W\d_]+(?:['/.-][^\W\d_]+)*", q) if len(w) >= MIN_TERM_LENGTH]
+    has_letters = bool(re.search(r"[^\W\d_]", q))
+    if has_letters:
+        digit_groups = [d for d in re.findall(r"\d+", q) if len(d) >= MIN_TERM_LENGTH]
+    else:
+        # a digits-only query is one NRIC fragment, dashes and spaces are just formatting
+        digits = re.sub(r"\D", "", q)
+        digit_groups = [digits] if len(digits) >= MIN_TERM_LENGTH else []
+
+    if not words and not digit_groups:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Search needs at least {MIN_TERM_LENGTH} letters or digits",
+        )
+    return words, digit_groups, has_letters
+
+
+def substitutions(fragment: str, nric_digits: str, limit: int):
+    """Fewest differing digits over every placement of `fragment` inside the NRIC, None if over `limit`"""
+    best = None
+    for start in range(len(nric_digits) - len(fragment) + 1):
+        differences = 0
+        for a, b in zip(fragment, nric_digits[start:start + len(fragment)]):
+            if a != b:
+                differences += 1
+                if differences > limit:
+                    break
+        if differences <= limit and (best is None or differences < best):
+            best = differences
+    return best
+
+
+def near_nric_candidates(db: Session, digits: str, max_substitutions: int, after_id: int = 0, limit: int = 50):
+    """
+    Patients whose NRIC contains `digits` with 1..max_substitutions digits different.
+
+    Pigeonhole: split the fragment into max_substitutions + 1 blocks; k substitutions
+    can touch at most k blocks, so at least one block appears unchanged and the
+    trigram index finds every candidate from the blocks alone. Candidates are then
+    checked digit by digit. Returns (id, substitutions) pairs in id order.
+    """
+    blocks = max_substitutions + 1
+    size = len(digits) // blocks
+    if size < MIN_TERM_LENGTH:
+        return []
+    pieces = [digits[i * size:(i + 1) * size] for i in range(blocks - 1)] + [digits[(blocks - 1) * size:]]
+    match = "nric : (" + " OR ".join(_phrase(p) for p in pieces) + ")"
+
+    rows = db.execute(
+        text("SELECT rowid, nric FROM patient_search WHERE patient_search MATCH :match AND rowid > :after ORDER BY rowid"),
+        {"match": match, "after": after_id},
+    )
+    found = []
+    for patient_id, nric_digits in rows:
+        distance = substitutions(digits, nric_digits, max_substitutions)
+        if distance:
+            found.append((patient_id, distance))
+            if len(found) >= limit:
+                break
+    return found
+
+
+def _search_nric(db: Session, digits: str, after, limit: int):
+    """Exact substring matches (sort key 0) in id order, then one-digit-off matches (sort key 1)"""
+    tier, after_id = after if after else (0, 0)
+    rows = []
+    if tier == 0:
+        rows = db.execute(text(f"""
+            SELECT {_COLUMNS}, 0 AS sort_key
+            FROM patient_search s JOIN patients p ON p.id = s.rowid
+            WHERE patient_search MATCH :match AND s.rowid > :after
+            ORDER BY s.rowid
+            LIMIT :limit
+        """), {"match": "nric : " + _phrase(digits), "after": after_id, "limit": limit}).mappings().all()
+        after_id = 0
+
+    if len(rows) < limit and len(digits) >= FUZZY_MIN_DIGITS:
+        near = near_nric_candidates(db, digits, 1, after_id, limit - len(rows))
+        if near:
+            ids = [patient_id for patient_id, _ in near]
+            placeholders = ", ".join(f":id{i}" for i in range(len(ids)))
+            rows = list(rows) + list(db.execute(
+                text(f"SELECT {_COLUMNS}, 1 AS sort_key FROM patients p WHERE p.id IN ({placeholders}) ORDER BY p.id"),
+                {f"id{i}": patient_id for i, patient_id in enumerate(ids)},
+            ).mappings().all())
+    return rows
+
+
+def _text_match(words, digit_groups):
+    """FTS5 query: every word in full_name and every digit group in nric"""
+    clauses = [f"full_name : {_phrase(w)}" for w in words] + [f"nric : {_phrase(d)}" for d in digit_groups]
+    return " AND ".join(clauses)
+
+
+def _count_matches(db: Session, match: str):
+    # stops counting at RANK_WINDOW, so this stays cheap for broad queries
+    return db.execute(
+        text("SELECT count(*) FROM (SELECT 1 FROM patient_search WHERE patient_search MATCH :match LIMIT :window)"),
+        {"match": match, "window": RANK_WINDOW},
+    ).scalar()
+
+
+def _search_text(db: Session, match: str, ranked: bool, after, limit: int):
+    """Rows for a name query, bm25 order if `ranked`, else registration order"""
+    params = {"match": match, "limit": limit}
+
+    keyset = ""
+    if after:
+        params["after_key"], params["after_id"] = after
+        keyset = "AND (s.rank, s.rowid) > (:after_key, :after_id)" if ranked else "AND s.rowid > :after_id"
+
+    sort_key, order = ("s.rank", "s.rank, s.rowid") if ranked else ("NULL", "s.rowid")
+    sql = f"""
+        SELECT {_COLUMNS}, {sort_key} AS sort_key
+        FROM patient_search s JOIN patients p ON p.id = s.rowid
+        WHERE patient_search MATCH :match {keyset}
+        ORDER BY {order}
+        LIMIT :limit
+    """
+    return db.execute(text(sql), params).mappings().all()
+
+
+def search_patients(q: str, limit: int = 20, cursor: str | None = None):
+    """Ranked candidates for a partial name / NRIC from every shard, plus the cursor for the next page"""
+    limit = max(1, min(limit, MAX_LIMIT))
+    words, digit_groups, has_letters = parse_query(q)
+    after = decode_cursor(cursor) if cursor else None
+
+    # one extra row tells us whether there is a next page
+    if has_letters:
+        match = _text_match(words, digit_groups)
+        # decided once for all shards (and kept by the cursor), so their pages merge in one order
+        ranked = after[0] is not None if after else sum(sharding.fan_out(_count_matches, match)) < RANK_WINDOW
+        pages = sharding.fan_out(_search_text, match, ranked, after, limit + 1)
+    else:
+        pages = sharding.fan_out(_search_nric, digit_groups[0], after, limit + 1)
+    rows = list(heapq.merge(*pages, key=lambda row: (row["sort_key"] or 0, row["id"])))[:limit + 1]
+
+    page = rows[:limit]
+    results = [
+        {
+            "user_id": str(row["id"]),
+            "full_name": row["full_name"],
+            "nric_number": row["nric_number"],
+            "birth_date": row["birth_date"],
+            "sex": row["sex"],
+            "match": "near" if not has_letters and row["sort_key"] else "exact",
+        }
+        for row in page
+    ]
+    next_cursor = encode_cursor(page[-1]["sort_key"], page[-1]["id"]) if len(rows) > limit else None
+    return {"results": results, "next_cursor": next_cursor}
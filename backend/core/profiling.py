@@ -0,0 +1,259 @@
+"""
+On-demand request profiling.
+
+A stdlib sampling profiler: while a profiled request is in flight a background
+thread snapshots the stacks of the threads running it every PROFILE_INTERVAL_MS
+and counts them. The result is kept in memory in folded-stack format
+("frame;frame;frame count" per line), which flamegraph.pl and speedscope
+render as a flame graph.
+
+Requests are profiled when:
+  - a clinic admin sends the header `X-Profile: 1` (or `?profile=1`), or
+  - they hit /viewpatientdata/profile or /mykadscan and are picked at random
+    with probability PROFILE_SAMPLE_RATE (default 0, i.e. off)
+
+On-demand profiles are kept in a small ring buffer; sampled profiles keep only
+the PROFILE_KEEP_SLOWEST slowest. Both are listed by GET /profiles.
+
+A thread is attributed to a request when its stack passes through the routed
+endpoint function, so concurrent calls to the same endpoint can show up in
+each other's profiles. Profile on a quiet worker when that matters.
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+from backend.auth import lookup_session
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_KEEP_SLOWEST = int(os.getenv("PROFILE_KEEP_SLOWEST", "20"))
+PROFILE_KEEP_REQUESTED = 20
+
+# routes eligible for continuous sampling
+SAMPLED_ROUTES = ("/viewpatientdata/profile", "/mykadscan")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Profile:
+    """Stack samples collected for one request"""
+
+    def __init__(self, scope, trigger: str):
+        self.id = secrets.token_urlsafe(8)
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.trigger = trigger  # "requested" or "sampled"
+        self.started_at = time.time()
+        self.duration = None
+        self.status = None
+        self.stacks = Counter()
+        self.samples = 0
+        # the request scope is filled in by the router (scope["endpoint"]) once routed
+        self._scope = scope
+        # worker threads that attached themselves to this request (see attach_current_thread)
+        self._threads = set()
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "status": self.status,
+            "samples": self.samples,
+        }
+
+    def folded(self):
+        """Folded stacks, one 'outer;...;inner count' line per distinct stack"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(PROJECT_ROOT):
+        filename = os.path.relpath(filename, PROJECT_ROOT)
+    else:
+        filename = "/".join(filename.replace("\\", "/").split("/")[-2:])
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class _Sampler:
+    """One background thread sampling every in-flight profile"""
+
+    def __init__(self):
+        self._active = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, profile):
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, profile):
+        with self._lock:
+            self._active.discard(profile)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            frames = sys._current_frames()
+            frames.pop(own_id, None)
+            for profile in active:
+                self._sample(profile, frames)
+            time.sleep(PROFILE_INTERVAL)
+
+    @staticmethod
+    def _sample(profile, frames):
+        endpoint = profile._scope.get("endpoint")
+        endpoint_code = getattr(endpoint, "__code__", None)
+
+        for thread_id, frame in frames.items():
+            attached = thread_id in profile._threads
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                # stacks are rooted at the endpoint so the flame graph starts there
+                if frame.f_code is endpoint_code:
+                    break
+                frame = frame.f_back
+            else:
+                if not attached:
+                    continue
+
+            profile.stacks[";".join(_frame_label(code) for code in reversed(stack))] += 1
+            profile.samples += 1
+
+
+_sampler = _Sampler()
+
+# profile of the request currently being handled, for attach_current_thread
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+_requested = deque(maxlen=PROFILE_KEEP_REQUESTED)
+# min-heap of (duration, tiebreak, profile) so the fastest is evicted first
+_slowest = []
+_tiebreak = itertools.count()
+_store_lock = threading.Lock()
+
+
+@contextmanager
+def attach_current_thread():
+    """Include the calling worker thread in the current request's profile (no-op if not profiling).
+    Use around work handed to a thread pool with the request's context copied in"""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    thread_id = threading.get_ident()
+    profile._threads.add(thread_id)
+    try:
+        yield
+    finally:
+        profile._threads.discard(thread_id)
+
+
+def list_profiles():
+    with _store_lock:
+        profiles = list(_requested) + [entry[2] for entry in _slowest]
+    return sorted((p.summary() for p in profiles), key=lambda s: s["duration_ms"] or 0, reverse=True)
+
+
+def get_profile(profile_id: str):
+    with _store_lock:
+        for profile in itertools.chain(_requested, (entry[2] for entry in _slowest)):
+            if profile.id == profile_id:
+                return profile
+    return None
+
+
+def _store(profile):
+    with _store_lock:
+        if profile.trigger == "requested":
+            _requested.append(profile)
+        elif len(_slowest) < PROFILE_KEEP_SLOWEST:
+            heapq.heappush(_slowest, (profile.duration, next(_tiebreak), profile))
+        elif profile.duration > _slowest[0][0]:
+            heapq.heapreplace(_slowest, (profile.duration, next(_tiebreak), profile))
+
+
+def _is_admin(scope):
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            # same checks as get_session: an expired token can't force profiling
+            session, _ = lookup_session(value.decode("latin-1"))
+            return session is not None and session["role"] == "clinic_admin"
+    return False
+
+
+def _profile_requested(scope):
+    for name, value in scope["headers"]:
+        if name == b"x-profile" and value in (b"1", b"true"):
+            return True
+    query = scope.get("query_string", b"")
+    return b"profile=" in query and parse_qs(query.decode("latin-1")).get("profile") in (["1"], ["true"])
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles admin-requested and randomly sampled requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _trigger(self, scope):
+        if _profile_requested(scope) and _is_admin(scope):
+            return "requested"
+        if PROFILE_SAMPLE_RATE > 0 and any(route in scope["path"] for route in SAMPLED_ROUTES):
+            if random.random() < PROFILE_SAMPLE_RATE:
+                return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope, trigger)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                if trigger == "requested":
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        _sampler.add(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration = time.perf_counter() - start
+            _sampler.remove(profile)
+            _current_profile.reset(token)
+            _store(profile)
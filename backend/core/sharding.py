@@ -0,0 +1,341 @@
+"""
+Hash-partitioned patient storage.
+
+With SHARD_COUNT=1 (the default) everything stays in DATABASE_URL. With
+SHARD_COUNT=N, patients are spread over N SQLite files, each with its own
+engine and connection pool, so writes for different patients no longer queue
+on one writer lock:
+
+    shard 0          DATABASE_URL (the existing app.db)
+    shard 1..N-1     SHARD_DATABASE_URL with {n} replaced by the shard number
+                     (default: app_shard{n}.db next to app.db)
+
+A patient lives on shard_for(nric): a jump consistent hash of the NRIC digits
+(dashes and spaces don't matter), so growing from N to N+1 shards moves only
+about 1/(N+1) of the patients. `python -m backend.rebalance_shards --from <old N>`
+moves them after SHARD_COUNT changes.
+
+Every shard has the full schema, and everything kept per patient (child
+records, search index, match keys, vocabulary links, aggregate counts, change
+tracking) is stored next to the patient, so each shard works like a small
+unsharded database:
+
+  - one patient (profiles, registration, clinic updates, emergency cards, exact
+    MyKad matches): a session on their shard, session_for / get_patient_db
+  - many patients (search, cohorts, analytics, near MyKad matches, sync):
+    fan_out runs the per-shard query on every shard, the caller merges
+
+Ids stay unique across shards: in sharded mode each shard hands out ids
+seq * ID_STRIDE + shard number from its own counters (shard_ids), which init_db
+raises above every id already stored. So user_id means one patient wherever
+they are stored, and rows keep their ids when they move.
+"""
+import contextvars
+import hashlib
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from backend import db as database
+from backend.core import patient_logic
+from backend.core.logs import get_logger
+from backend.core.metrics import instrument_engine
+
+SHARD_COUNT = max(1, int(os.getenv("SHARD_COUNT", "1")))
+SHARD_DATABASE_URL = os.getenv("SHARD_DATABASE_URL")
+
+# ids are seq * ID_STRIDE + shard number, so this is also the most shards there can be
+ID_STRIDE = 1024
+# patients moved per transaction when rebalancing
+REBALANCE_BATCH = 2000
+
+# tables whose ids are handed out per shard, children after the patients they belong to
+SHARDED_MODELS = [
+    patient_logic.Patient,
+    patient_logic.PreviousMajorSurgeries,
+    patient_logic.MedicationPrescription,
+    patient_logic.Immunization,
+    patient_logic.PresentingComplaint,
+    patient_logic.EmergencyContact,
+]
+
+log = get_logger("sharding")
+
+if SHARD_COUNT > ID_STRIDE:
+    raise ValueError(f"SHARD_COUNT can be at most {ID_STRIDE}")
+
+
+""" SHARDS """
+
+_engines = {0: database.engine}
+_sessions = {0: database.SessionLocal}
+# engine -> shard number, for the id counters
+_numbers = {database.engine: 0}
+_lock = threading.Lock()
+
+
+def shard_url(n: int):
+    if n == 0:
+        return database.DATABASE_URL
+    if SHARD_DATABASE_URL:
+        return SHARD_DATABASE_URL.format(n=n)
+    root, ext = os.path.splitext(database.DATABASE_URL)
+    return f"{root}_shard{n}{ext or '.db'}"
+
+
+def engine_for(n: int):
+    engine = _engines.get(n)
+    if engine is None:
+        with _lock:
+            if n not in _engines:
+                engine = create_engine(shard_url(n), connect_args={"check_same_thread": False})
+                database.configure_sqlite(engine)
+                instrument_engine(engine)
+                _sessions[n] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _numbers[engine] = n
+                _engines[n] = engine
+            engine = _engines[n]
+    return engine
+
+
+def session_factory(n: int):
+    engine_for(n)
+    return _sessions[n]
+
+
+def engines():
+    return [engine_for(n) for n in range(SHARD_COUNT)]
+
+
+""" PLACEMENT """
+
+def jump_hash(key: int, buckets: int):
+    """Jump consistent hash (Lamping & Veach): going from n to n+1 buckets only moves keys into the new one"""
+    bucket, j = -1, 0
+    while j < buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) % 2**64
+        j = int((bucket + 1) * (2**31 / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(nric: str, count: int | None = None):
+    """Shard number of an NRIC, with or without dashes"""
+    count = count or SHARD_COUNT
+    if count == 1:
+        return 0
+    digits = re.sub(r"\D", "", nric or "")
+    key = int.from_bytes(hashlib.blake2b(digits.encode(), digest_size=8).digest(), "big")
+    return jump_hash(key, count)
+
+
+def session_for(nric: str):
+    """New session on the NRIC's shard; the caller closes it"""
+    return session_factory(shard_for(nric))()
+
+
+@contextmanager
+def patient_session(nric: str):
+    db = session_for(nric)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_patient_db(nric: str):
+    """Like get_db, on the shard of the route's `nric` query parameter"""
+    with patient_session(nric) as db:
+        yield db
+
+
+""" FAN-OUT """
+
+# shards are queried concurrently: SQLite releases the GIL while it works
+_pool = ThreadPoolExecutor(max_workers=SHARD_COUNT, thread_name_prefix="shard") if SHARD_COUNT > 1 else None
+
+
+def _on_shard(n: int, function, args, kwargs):
+    db = session_factory(n)()
+    try:
+        return function(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+def _run_all(calls):
+    if _pool is None:
+        return [_on_shard(0, *calls[0])]
+    # each shard keeps the request's context (per-request query metrics)
+    futures = [
+        _pool.submit(contextvars.copy_context().run, _on_shard, n, function, args, kwargs)
+        for n, (function, args, kwargs) in enumerate(calls)
+    ]
+    return [future.result() for future in futures]
+
+
+def fan_out(function, *args, **kwargs):
+    """[function(db, *args, **kwargs) for every shard], in shard order"""
+    return _run_all([(function, args, kwargs)] * SHARD_COUNT)
+
+
+def map_shards(function, values, *args):
+    """[function(db, values[n], *args) for every shard n]: per-shard arguments, e.g. sync cursors"""
+    return _run_all([(function, (value,) + args, {}) for value in values])
+
+
+""" IDS """
+
+def next_id(connection, table: str):
+    seq = connection.execute(
+        text("UPDATE shard_ids SET seq = seq + 1 WHERE table_name = :table RETURNING seq"), {"table": table}
+    ).scalar()
+    if seq is None:
+        raise RuntimeError(f"No id counter for {table}, run python -m backend.init_db")
+    return seq * ID_STRIDE + _numbers[connection.engine]
+
+
+def _assign_id(mapper, connection, target):
+    if target.id is None:
+        target.id = next_id(connection, mapper.local_table.name)
+
+
+if SHARD_COUNT > 1:
+    for _model in SHARDED_MODELS:
+        event.listen(_model, "before_insert", _assign_id)
+
+
+def install_id_counters():
+    """Create every shard's id counters and raise them above every id already stored (init_db, sharded mode)"""
+    if SHARD_COUNT == 1:
+        return
+    tables = [model.__table__.name for model in SHARDED_MODELS]
+    floors = dict.fromkeys(tables, 0)
+    for engine in engines():
+        with engine.connect() as conn:
+            for table in tables:
+                top = conn.exec_driver_sql(f"SELECT max(id) FROM {table}").scalar() or 0
+                floors[table] = max(floors[table], top // ID_STRIDE)
+
+    for engine in engines():
+        with engine.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS shard_ids (table_name TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+            for table, floor in floors.items():
+                conn.exec_driver_sql(
+                    "INSERT INTO shard_ids (table_name, seq) VALUES (?, ?) "
+                    "ON CONFLICT (table_name) DO UPDATE SET seq = max(seq, excluded.seq)",
+                    (table, floor),
+                )
+
+
+""" REBALANCING """
+
+def _existing_shards(count: int):
+    """Shard numbers below `count` whose database exists (shards past SHARD_COUNT may never have been created)"""
+    found = []
+    for n in range(count):
+        path = database.DATABASE_URL if n == 0 else shard_url(n)
+        if n < SHARD_COUNT or os.path.exists(path.removeprefix("sqlite:///")):
+            found.append(n)
+    return found
+
+
+def _columns(conn, schema: str, table: str):
+    return [row[1] for row in conn.exec_driver_sql(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _move(source, target, patient_ids):
+    """Move patients with their child rows and vocabulary links, in one transaction over both files"""
+    ids = ", ".join(str(int(i)) for i in patient_ids)
+    children = [model.__table__.name for model in SHARDED_MODELS[1:]]
+    with source.connect() as conn:
+        conn.exec_driver_sql("ATTACH DATABASE ? AS target", (target.url.database,))
+        try:
+            # rows already in the target (a rerun after an interrupted move) are replaced
+            for table in children:
+                conn.exec_driver_sql(f"DELETE FROM target.{table} WHERE patient_id IN ({ids})")
+            conn.exec_driver_sql(f"DELETE FROM target.patient_terms WHERE patient_id IN ({ids})")
+            conn.exec_driver_sql(f"DELETE FROM target.patients WHERE id IN ({ids})")
+
+            for table, key in [("patients", "id")] + [(table, "patient_id") for table in children]:
+                target_columns = set(_columns(conn, "target", table))
+                columns = ", ".join(c for c in _columns(conn, "main", table) if c in target_columns)
+                conn.exec_driver_sql(f"INSERT INTO target.{table} ({columns}) SELECT {columns} FROM main.{table} WHERE {key} IN ({ids})")
+
+            # term ids are per shard, so links are matched up by (kind, term)
+            conn.exec_driver_sql(f"""
+                INSERT OR IGNORE INTO target.clinical_terms (kind, term)
+                SELECT DISTINCT ct.kind, ct.term FROM main.clinical_terms ct
+                JOIN main.patient_terms pt ON pt.term_id = ct.id WHERE pt.patient_id IN ({ids})
+            """)
+            conn.exec_driver_sql(f"""
+                INSERT OR IGNORE INTO target.patient_terms (term_id, patient_id)
+                SELECT tt.id, pt.patient_id FROM main.patient_terms pt
+                JOIN main.clinical_terms ct ON ct.id = pt.term_id
+                JOIN target.clinical_terms tt ON tt.kind = ct.kind AND tt.term = ct.term
+                WHERE pt.patient_id IN ({ids})
+            """)
+
+            before = conn.exec_driver_sql("SELECT seq FROM main.change_counter WHERE id = 1").scalar()
+            conn.exec_driver_sql(f"DELETE FROM main.patient_terms WHERE patient_id IN ({ids})")
+            for table in reversed(children):
+                conn.exec_driver_sql(f"DELETE FROM main.{table} WHERE patient_id IN ({ids})")
+            conn.exec_driver_sql(f"DELETE FROM main.patients WHERE id IN ({ids})")
+            # the rows still exist on the target, so synced clients must not delete them
+            conn.exec_driver_sql("DELETE FROM main.sync_tombstones WHERE change_seq > ?", (before,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.exec_driver_sql("DETACH DATABASE target")
+
+
+def rebalance(previous_count: int, batch_size: int = REBALANCE_BATCH, dry_run: bool = False, progress=None):
+    """Move every patient stored on the wrong shard for SHARD_COUNT to the right one.
+    Returns Counter of (from shard, to shard) -> patients. Run with the app stopped."""
+    from backend.core import aggregates
+
+    moved = Counter()
+    for source in _existing_shards(max(previous_count, SHARD_COUNT)):
+        engine = engine_for(source)
+        after = 0
+        while True:
+            with engine.connect() as conn:
+                rows = conn.exec_driver_sql(
+                    "SELECT id, nric_number FROM patients WHERE id > ? ORDER BY id LIMIT ?", (after, batch_size)
+                ).all()
+            if not rows:
+                break
+            after = rows[-1][0]
+
+            targets = defaultdict(list)
+            for patient_id, nric in rows:
+                target = shard_for(nric)
+                if target != source:
+                    targets[target].append(patient_id)
+            for target, patient_ids in sorted(targets.items()):
+                if not dry_run:
+                    _move(engine, engine_for(target), patient_ids)
+                moved[(source, target)] += len(patient_ids)
+            if progress:
+                progress(moved)
+
+    if moved and not dry_run:
+        # moved rows keep their ids; keep new ones above them
+        install_id_counters()
+        # counts are per shard; recount where patients left or arrived
+        for n in sorted({s for s, _ in moved} | {t for _, t in moved}):
+            db = session_factory(n)()
+            try:
+                aggregates.reconcile(db)
+            finally:
+                db.close()
+        log.info("shards rebalanced", extra={"fields": {"patients": sum(moved.values()), "shards": SHARD_COUNT}})
+    return moved
@@ -0,0 +1,231 @@
+"""
+Change tracking and delta sync for clinic-side caches.
+
+Every row of `patients` and its child tables carries a change_seq: a number
+from one shared counter, bumped by triggers on every insert and update, so
+"everything that changed since N" is an indexed range scan per table. Deleted
+rows leave a tombstone with their own change_seq. SQLite runs one write
+transaction at a time, so a transaction can never commit a lower change_seq
+after a client has already seen a higher one.
+
+    GET /clinicadmin/sync?since=<seq>&limit=<rows>
+
+streams newline-delimited JSON, oldest change first, one line per row:
+
+    {"seq": 41, "table": "patients", "op": "upsert", "id": 7, "patient_id": 7, "data": {...}}
+    {"seq": 42, "table": "presenting_complaints", "op": "delete", "id": 3, "patient_id": 7}
+
+and ends with {"next_since": 42, "has_more": true}. Clients store next_since
+and call again until has_more is false. Only what clinic admins may see is
+synced (the ClinicPatientViewResponse fields).
+
+With SHARD_COUNT > 1 each shard has its own counter and the cursor is one
+number per shard, "41.7.19" (seq is then per shard). A cursor from a different
+shard count is refused; clients start again from since=0.
+
+`install_change_tracking` (called from init_db) adds the column to existing
+databases, numbers existing rows and creates the triggers.
+"""
+import heapq
+import json
+from itertools import islice
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.core import patient_logic, sharding
+
+MAX_LIMIT = 5000
+
+TRACKED_MODELS = [
+    patient_logic.Patient,
+    patient_logic.PreviousMajorSurgeries,
+    patient_logic.MedicationPrescription,
+    patient_logic.Immunization,
+    patient_logic.PresentingComplaint,
+    patient_logic.EmergencyContact,
+]
+
+# table -> columns sent to clinics
+CLINIC_SYNC_COLUMNS = {
+    "patients": ["full_name", "sex", "birth_date", "nric_number"],
+    "medication_prescriptions": ["prescription_name", "prescription_dose", "date", "additional_info"],
+    "presenting_complaints": ["complaint", "date", "additional_info"],
+}
+
+
+""" CHANGE TRACKING """
+
+def _data_columns(table):
+    return [c.name for c in table.columns if c.name not in ("id", "change_seq")]
+
+
+def _patient_id_sql(table, row: str):
+    return f"{row}.id" if table.name == "patients" else f"{row}.patient_id"
+
+
+def _triggers(table):
+    name = table.name
+    next_seq = "UPDATE change_counter SET seq = seq + 1 WHERE id = 1"
+    current_seq = "(SELECT seq FROM change_counter WHERE id = 1)"
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_change_insert AFTER INSERT ON {name} BEGIN
+            {next_seq};
+            UPDATE {name} SET change_seq = {current_seq} WHERE id = new.id;
+        END
+        """,
+        # only data columns, so setting change_seq itself doesn't count as a change
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_change_update AFTER UPDATE OF {", ".join(_data_columns(table))} ON {name} BEGIN
+            {next_seq};
+            UPDATE {name} SET change_seq = {current_seq} WHERE id = new.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_change_delete AFTER DELETE ON {name} BEGIN
+            {next_seq};
+            INSERT INTO sync_tombstones(change_seq, table_name, row_id, patient_id)
+            VALUES ({current_seq}, '{name}', old.id, {_patient_id_sql(table, 'old')});
+        END
+        """,
+    ]
+
+
+def install_change_tracking(engine):
+    """Add change_seq where missing, number rows that have none, create the counter and triggers"""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS change_counter (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)")
+        conn.exec_driver_sql("INSERT OR IGNORE INTO change_counter (id, seq) VALUES (1, 0)")
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS sync_tombstones (change_seq INTEGER PRIMARY KEY, table_name TEXT NOT NULL, row_id INTEGER NOT NULL, patient_id INTEGER)"
+        )
+
+        for model in TRACKED_MODELS:
+            name = model.__table__.name
+            columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({name})")}
+            if "change_seq" not in columns:
+                # databases created before change tracking
+                conn.exec_driver_sql(f"ALTER TABLE {name} ADD COLUMN change_seq INTEGER")
+            conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_{name}_change_seq ON {name} (change_seq)")
+
+            # rows without a number (existing data) get a fresh block of the sequence
+            base = conn.exec_driver_sql("SELECT seq FROM change_counter WHERE id = 1").scalar()
+            top = conn.exec_driver_sql(f"SELECT max(id) FROM {name} WHERE change_seq IS NULL").scalar()
+            if top is not None:
+                conn.exec_driver_sql(f"UPDATE {name} SET change_seq = {base} + id WHERE change_seq IS NULL")
+                conn.exec_driver_sql(f"UPDATE change_counter SET seq = {base + top} WHERE id = 1")
+
+            for statement in _triggers(model.__table__):
+                conn.exec_driver_sql(statement)
+
+
+""" SYNC """
+
+def _table_changes(db: Session, table: str, columns, since: int, limit: int):
+    patient_column = "id" if table == "patients" else "patient_id"
+    rows = db.execute(
+        text(f"""
+            SELECT change_seq, id, {patient_column} AS patient_id, {", ".join(columns)}
+            FROM {table}
+            WHERE change_seq > :since
+            ORDER BY change_seq
+            LIMIT :limit
+        """),
+        {"since": since, "limit": limit},
+    ).mappings()
+    return [
+        {
+            "seq": row["change_seq"],
+            "table": table,
+            "op": "upsert",
+            "id": row["id"],
+            "patient_id": row["patient_id"],
+            "data": {column: row[column] for column in columns},
+        }
+        for row in rows
+    ]
+
+
+def _tombstones(db: Session, since: int, limit: int):
+    rows = db.execute(
+        text("""
+            SELECT change_seq, table_name, row_id, patient_id
+            FROM sync_tombstones
+            WHERE change_seq > :since AND table_name IN ('patients', 'medication_prescriptions', 'presenting_complaints')
+            ORDER BY change_seq
+            LIMIT :limit
+        """),
+        {"since": since, "limit": limit},
+    )
+    return [
+        {"seq": seq, "table": table, "op": "delete", "id": row_id, "patient_id": patient_id}
+        for seq, table, row_id, patient_id in rows
+    ]
+
+
+def changes_since(db: Session, since: int, limit: int):
+    """(changes, next_since, has_more): the `limit` oldest changes after `since`, all tables merged"""
+    limit = max(1, min(limit, MAX_LIMIT))
+    # each table already comes back in change_seq order; one extra row tells us if there is more
+    streams = [_table_changes(db, table, columns, since, limit + 1) for table, columns in CLINIC_SYNC_COLUMNS.items()]
+    streams.append(_tombstones(db, since, limit + 1))
+
+    merged = list(heapq.merge(*streams, key=lambda change: change["seq"]))
+    page = merged[:limit]
+    next_since = page[-1]["seq"] if page else since
+    return page, next_since, len(merged) > limit
+
+
+def parse_cursor(since: str):
+    """Per-shard change_seq from a sync cursor: "42", or "42.7.19" with one number per shard"""
+    try:
+        values = [int(value) for value in since.split(".")]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync cursor")
+    if values == [0]:
+        return [0] * sharding.SHARD_COUNT
+    if len(values) != sharding.SHARD_COUNT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Sync cursor is from a different shard layout, sync again from since=0",
+        )
+    return values
+
+
+def sync_page(since: str, limit: int):
+    """(changes, next cursor, has_more) over every shard"""
+    cursor = parse_cursor(since)
+    limit = max(1, min(limit, MAX_LIMIT))
+    pages = sharding.map_shards(changes_since, cursor, limit)
+
+    # shards are independent, so their changes are just interleaved up to `limit` in total
+    streams = [[(n, change) for change in page] for n, (page, _, _) in enumerate(pages)]
+    taken = list(islice(heapq.merge(*streams, key=lambda item: item[1]["seq"]), limit))
+    next_cursor = list(cursor)
+    for n, change in taken:
+        next_cursor[n] = change["seq"]
+    has_more = len(taken) < sum(len(stream) for stream in streams) or any(more for _, _, more in pages)
+    return [change for _, change in taken], next_cursor, has_more
+
+
+def sync_response(since: str, limit: int):
+    """NDJSON response for one sync page; the cursor is also sent as X-Next-Since / X-Has-More"""
+    changes, next_cursor, has_more = sync_page(since, limit)
+    # a plain number when unsharded, as before
+    next_since = next_cursor[0] if len(next_cursor) == 1 else ".".join(map(str, next_cursor))
+
+    def lines():
+        for change in changes:
+            yield json.dumps(change, default=str, separators=(",", ":")) + "\n"
+        yield json.dumps({"next_since": next_since, "has_more": has_more}) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"X-Next-Since": str(next_since), "X-Has-More": "true" if has_more else "false"},
+    )
@@ -0,0 +1,207 @@
+"""
+Clinical vocabulary for cohort queries.
+
+Allergies, chronic conditions, medications and immunizations are stored as free
+text (JSON lists on `patients`, names on the child tables), so "every patient
+with a penicillin allergy" used to mean reading and decoding every row. Each
+distinct term is now stored once in clinical_terms, and patient_terms links
+patients to the terms they have:
+
+    clinical_terms(id, kind, term)      -- UNIQUE (kind, term), term normalized
+    patient_terms(term_id, patient_id)  -- PRIMARY KEY (term_id, patient_id)
+
+so a cohort filter is an index range per term, joined on patient_id.
+
+Terms are normalized (whitespace collapsed, case folded), so "Penicillin " and
+"penicillin" are one term. Registration and clinic updates link their terms as
+they write (link_terms); `python -m backend.backfill_vocabulary` rebuilds the
+links for patients stored before, or written some other way (e.g. the benchmark
+seeder). The free-text columns stay as they are, the profile responses still
+come from them.
+"""
+import heapq
+
+from fastapi import HTTPException, status
+from sqlalchemy import ForeignKey, Index, String, UniqueConstraint, select, delete, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Mapped, Session, mapped_column
+
+from backend.db import Base
+from backend.core import patient_logic, sharding
+
+# allergy / chronic_condition: Patient JSON lists; medication / immunization: child table names
+TERM_KINDS = ["allergy", "chronic_condition", "medication", "immunization"]
+
+MAX_LIMIT = 500
+BACKFILL_BATCH = 2000
+
+
+class ClinicalTerm(Base):
+    __tablename__ = "clinical_terms"
+    __table_args__ = (UniqueConstraint("kind", "term", name="uq_clinical_terms_kind_term"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String, nullable=False)
+    term: Mapped[str] = mapped_column(String, nullable=False)
+
+
+class PatientTerm(Base):
+    __tablename__ = "patient_terms"
+    __table_args__ = (
+        Index("ix_patient_terms_patient", "patient_id"),
+        {"sqlite_with_rowid": False},
+    )
+
+    term_id: Mapped[int] = mapped_column(ForeignKey("clinical_terms.id"), primary_key=True)
+    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), primary_key=True)
+
+
+""" TERMS """
+
+def normalize_term(value):
+    if not isinstance(value, str):
+        return None
+    term = " ".join(value.split()).casefold()
+    return term or None
+
+
+def intern_terms(db: Session, kind: str, values):
+    """{normalized term: id} for `values`, adding the terms not seen before"""
+    terms = {t for t in (normalize_term(v) for v in values) if t}
+    if not terms:
+        return {}
+    db.execute(
+        insert(ClinicalTerm).on_conflict_do_nothing(index_elements=["kind", "term"]),
+        [{"kind": kind, "term": t} for t in terms],
+    )
+    rows = db.execute(
+        select(ClinicalTerm.term, ClinicalTerm.id).where(ClinicalTerm.kind == kind, ClinicalTerm.term.in_(terms))
+    )
+    return dict(rows.all())
+
+
+def link_terms(db: Session, patient_id: int, kind: str, values):
+    """Link the patient to these terms (part of the caller's transaction); returns the terms that are new for them"""
+    ids = intern_terms(db, kind, values or [])
+    if not ids:
+        return set()
+    linked = set(db.execute(
+        select(PatientTerm.term_id).where(PatientTerm.patient_id == patient_id, PatientTerm.term_id.in_(ids.values()))
+    ).scalars())
+    new = {term: term_id for term, term_id in ids.items() if term_id not in linked}
+    if new:
+        db.execute(
+            insert(PatientTerm).on_conflict_do_nothing(),
+            [{"term_id": term_id, "patient_id": patient_id} for term_id in new.values()],
+        )
+    return set(new)
+
+
+""" BACKFILL """
+
+def _batch_terms(db: Session, patient_ids):
+    """{kind: [(patient_id, raw value), ...]} for a batch of patients"""
+    found = {kind: [] for kind in TERM_KINDS}
+    Patient = patient_logic.Patient
+    for patient_id, allergies, conditions in db.execute(
+        select(Patient.id, Patient.allergies, Patient.chronic_conditions).where(Patient.id.in_(patient_ids))
+    ):
+        found["allergy"] += [(patient_id, v) for v in allergies or []]
+        found["chronic_condition"] += [(patient_id, v) for v in conditions or []]
+
+    for kind, model, column in [
+        ("medication", patient_logic.MedicationPrescription, patient_logic.MedicationPrescription.prescription_name),
+        ("immunization", patient_logic.Immunization, patient_logic.Immunization.immunization_name),
+    ]:
+        found[kind] += db.execute(select(model.patient_id, column).where(model.patient_id.in_(patient_ids))).all()
+    return found
+
+
+def backfill(db: Session, batch_size: int = BACKFILL_BATCH, progress=None):
+    """Rebuild every patient's links from the free-text columns, one transaction per batch"""
+    stats = {"patients": 0, "links": 0}
+    after = 0
+    while True:
+        patient_ids = db.execute(
+            select(patient_logic.Patient.id).where(patient_logic.Patient.id > after)
+            .order_by(patient_logic.Patient.id).limit(batch_size)
+        ).scalars().all()
+        if not patient_ids:
+            break
+
+        links = set()
+        for kind, values in _batch_terms(db, patient_ids).items():
+            ids = intern_terms(db, kind, [v for _, v in values])
+            links |= {(ids[normalize_term(v)], patient_id) for patient_id, v in values if normalize_term(v)}
+
+        db.execute(delete(PatientTerm).where(PatientTerm.patient_id.in_(patient_ids)))
+        if links:
+            db.execute(insert(PatientTerm), [{"term_id": t, "patient_id": p} for t, p in links])
+        db.commit()
+
+        stats["patients"] += len(patient_ids)
+        stats["links"] += len(links)
+        after = patient_ids[-1]
+        if progress:
+            progress(stats)
+    return stats
+
+
+""" COHORTS """
+
+def _cohort_rows(db: Session, filters: dict, after: int, limit: int):
+    """Up to `limit` patients on this shard having every {kind: term}, in id order after `after`"""
+    term_ids = []
+    for kind, value in filters.items():
+        term = normalize_term(value)
+        term_id = db.execute(
+            select(ClinicalTerm.id).where(ClinicalTerm.kind == kind, ClinicalTerm.term == term)
+        ).scalar()
+        if term_id is None:
+            # a term nobody here has
+            return []
+        term_ids.append(term_id)
+
+    # one patient_terms range per term, joined on patient_id
+    joins = "".join(
+        f" JOIN patient_terms t{i} ON t{i}.term_id = :t{i} AND t{i}.patient_id = t0.patient_id"
+        for i in range(1, len(term_ids))
+    )
+    params = {f"t{i}": term_id for i, term_id in enumerate(term_ids)}
+    params.update({"after": after, "limit": limit})
+    return db.execute(text(f"""
+        SELECT p.id, p.full_name, p.nric_number, p.birth_date, p.sex
+        FROM patient_terms t0{joins}
+        JOIN patients p ON p.id = t0.patient_id
+        WHERE t0.term_id = :t0 AND t0.patient_id > :after
+        ORDER BY t0.patient_id
+        LIMIT :limit
+    """), params).mappings().all()
+
+
+def cohort_patients(filters: dict, after: int = 0, limit: int = 100):
+    """Patients having every {kind: term} in `filters`, in id order after `after`, from every shard"""
+    if not filters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Give at least one of: {', '.join(TERM_KINDS)}",
+        )
+    limit = max(1, min(limit, MAX_LIMIT))
+    # term ids are per shard, so each shard resolves the terms itself
+    pages = sharding.fan_out(_cohort_rows, filters, after, limit + 1)
+    rows = list(heapq.merge(*pages, key=lambda row: row["id"]))[:limit + 1]
+
+    page = rows[:limit]
+    return {
+        "results": [
+            {
+                "user_id": str(row["id"]),
+                "full_name": row["full_name"],
+                "nric_number": row["nric_number"],
+                "birth_date": row["birth_date"],
+                "sex": row["sex"],
+            }
+            for row in page
+        ],
+        "next_after": page[-1]["id"] if len(rows) > limit else None,
+    }
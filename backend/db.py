@@ -1,23 +1,69 @@
 
 import os
-from sqlalchemy import create_engine, Column, Integer, Float, String, Date, ForeignKey, JSON, Boolean, Date
+from sqlalchemy import create_engine, event, Column, Integer, Float, String, Date, ForeignKey, JSON, Boolean, Date
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship, Mapped, mapped_column
 from typing import List, Dict
 from datetime import date
+from backend.core.metrics import instrument_engine
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-DATABASE_URL = "sqlite:///" + os.path.join(basedir, 'app.db')
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///" + os.path.join(basedir, 'app.db'))
+# milliseconds a write waits for another connection's write lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "30000"))
+
+
+def configure_sqlite(engine):
+    """WAL journal and a busy timeout on every connection of a SQLite engine, so readers don't block
+    writers and concurrent writers (other workers, other processes) wait their turn instead of failing"""
+    if engine.dialect.name != "sqlite" or engine.url.database in (None, "", ":memory:"):
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # first, so switching the journal mode also waits out a writer
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
 
 engine = create_engine(
     DATABASE_URL, 
     connect_args={"check_same_thread": False}
 )
+configure_sqlite(engine)
+# per-request query counts and durations for /metrics
+instrument_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
+def init_db():
+    """Create any missing tables, on every shard. Run once per deployment (see backend/init_db.py), not per worker"""
+    # models register themselves on Base when their module is imported
+    import backend.core.patient_logic  # noqa: F401
+    import backend.core.vocabulary  # noqa: F401
+    import backend.core.aggregates  # noqa: F401
+    from backend.core.patient_search import install_search_index
+    from backend.core.nric_match import install_match_index
+    from backend.core.sync import install_change_tracking
+    from backend.core import sharding
+
+    # each shard holds the full schema (just DATABASE_URL unless SHARD_COUNT > 1)
+    for shard_engine in sharding.engines():
+        Base.metadata.create_all(bind=shard_engine)
+        # create_all skips tables that already exist, so add indexes declared on them since
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=shard_engine, checkfirst=True)
+        install_search_index(shard_engine)
+        install_match_index(shard_engine)
+        install_change_tracking(shard_engine)
+    sharding.install_id_counters()
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+"""
+Create the database schema out of band.
+Run this once before starting the server instead of on every worker import:
+
+    python -m backend.init_db
+"""
+from backend.db import init_db
+from backend.core import sharding
+
+
+def main():
+    init_db()
+    for n in range(sharding.SHARD_COUNT):
+        print(f"[OK] Database schema ready: {sharding.shard_url(n)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""
+Move patients to the shard their NRIC belongs on after SHARD_COUNT changed
+(see backend/core/sharding.py). Stop the app first, then run with the new
+SHARD_COUNT and the previous one:
+
+    SHARD_COUNT=4 python -m backend.rebalance_shards --from 1             # app.db -> 4 shards
+    SHARD_COUNT=4 python -m backend.rebalance_shards --from 1 --dry-run   # only count what would move
+
+Each batch of patients moves with their child rows and vocabulary links in one
+transaction over both files, so an interrupted run can simply be started again.
+Sync clients must start again from since=0 afterwards.
+"""
+import argparse
+
+from backend.db import init_db
+from backend.core import sharding
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move patients to their shard after SHARD_COUNT changed")
+    parser.add_argument("--from", dest="previous", type=int, required=True, help="SHARD_COUNT the data was stored with")
+    parser.add_argument("--batch-size", type=int, default=sharding.REBALANCE_BATCH, help="patients per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="count the patients that would move, move nothing")
+    args = parser.parse_args()
+
+    # creates the schema on new shards
+    init_db()
+    moved = sharding.rebalance(
+        args.previous, args.batch_size, args.dry_run,
+        progress=lambda m: print(f"  {sum(m.values())} patients", end="\r", flush=True),
+    )
+
+    print()
+    for (source, target), patients in sorted(moved.items()):
+        print(f"  shard {source} -> shard {target}: {patients} patients")
+    action = "would move" if args.dry_run else "moved"
+    print(f"[OK] {sum(moved.values())} patients {action}, {args.previous} -> {sharding.SHARD_COUNT} shards")
+
+
+if __name__ == "__main__":
+    main()
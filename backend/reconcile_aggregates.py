@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+Recount the analytics aggregates from the patient data and report drift
+(see backend/core/aggregates.py). Run once after upgrading to fill them for
+existing patients, and whenever the counts look off:
+
+    python -m backend.reconcile_aggregates             # report drift and store the recount
+    python -m backend.reconcile_aggregates --dry-run   # only report
+"""
+import argparse
+
+from backend.db import init_db
+from backend.core import aggregates, sharding
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recount the analytics aggregates and report drift")
+    parser.add_argument("--dry-run", action="store_true", help="report drift without storing the recount")
+    args = parser.parse_args()
+
+    init_db()
+    # each shard counts its own patients
+    for n, drift in enumerate(sharding.fan_out(aggregates.reconcile, fix=not args.dry_run)):
+        for dimension, bucket, stored, actual in drift:
+            print(f"  {dimension:<18} {bucket or '-':<24} stored {stored:>8}  actual {actual:>8}  ({actual - stored:+d})")
+        action = "reported" if args.dry_run else "fixed"
+        print(f"[OK] {len(drift)} drifted buckets {action} ({sharding.shard_url(n)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+# external imports
+from fastapi import APIRouter, Depends
+
+# local imports
+from backend.auth import require_auth
+from backend.core import aggregates
+import backend.schemas as schemas
+
+router = APIRouter()
+
+# patient counts by blood type, sex, age band, chronic condition and medication (read-only, from patient_aggregates)
+@router.get("/cohorts", response_model=schemas.CohortCounts)
+def cohort_counts(session=Depends(require_auth(["doctor", "clinic_admin"]))):
+    return aggregates.summary()
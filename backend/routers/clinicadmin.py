@@ -1,5 +1,6 @@
 # external imports
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 from sqlalchemy.orm import Session
 from datetime import datetime, date, timedelta
@@ -8,7 +9,9 @@ from datetime import datetime, date, timedelta
 from backend.db import get_db
 from backend.auth import require_auth
 from backend.core.ocrmodule import ocr_mykad_image
-from backend.core import patient_logic
+from backend.core.admission import rate_limit_ocr
+from backend.core import ocr_jobs, audit
+from backend.core import patient_logic, patient_search, nric_match, sync, vocabulary, aggregates, sharding
 import backend.schemas as schemas
 
 router = APIRouter()
@@ -16,10 +19,37 @@ router = APIRouter()
 """ CLINIC VIEWING PATIENT DATA"""
 
 # confirmed by frontend, this is to get data from ic scan and return that text to frontend
-@router.post("/viewpatientdata/mykadscan")
-async def ocr_mykadscan(file: UploadFile = File(...), db: Session = Depends(get_db), session=Depends(require_auth(["clinic_admin"]))):
-    # reminder: save raw ocr text to database
-    return await ocr_mykad_image(file)
+@router.post("/viewpatientdata/mykadscan", dependencies=[Depends(rate_limit_ocr)])
+async def ocr_mykadscan(request: Request, file: UploadFile = File(...), db: Session = Depends(get_db), session=Depends(require_auth(["clinic_admin"]))):
+    scan = await ocr_mykad_image(file)
+    audit.record("mykad_scan", request, session, nric=scan["nric"], raw_ocr=scan["raw_ocr"])
+    return scan
+
+# same scan as above, but answered straight away with a job id; poll the job or listen on its events
+@router.post("/viewpatientdata/mykadscan/jobs", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(rate_limit_ocr)])
+async def submit_ocr_job(request: Request, file: UploadFile = File(...), session=Depends(require_auth(["clinic_admin"]))):
+    return await ocr_jobs.submit_job(file, request, session)
+
+@router.get("/viewpatientdata/mykadscan/jobs/{job_id}")
+def get_ocr_job(job_id: str, request: Request, session=Depends(require_auth(["clinic_admin"]))):
+    return ocr_jobs.job_status(job_id, request)
+
+@router.get("/viewpatientdata/mykadscan/jobs/{job_id}/events")
+def get_ocr_job_events(job_id: str, request: Request, session=Depends(require_auth(["clinic_admin"]))):
+    return ocr_jobs.job_events(job_id, request)
+
+# scan and find the patient in one request: the profile on an exact NRIC match, otherwise ranked candidates
+@router.post("/viewpatientdata/mykadscan/lookup", response_model=schemas.ClinicMykadLookupResponse, dependencies=[Depends(rate_limit_ocr)])
+async def ocr_mykadscan_lookup(request: Request, file: UploadFile = File(...), session=Depends(require_auth(["clinic_admin"]))):
+    scan = await ocr_mykad_image(file)
+    result = await run_in_threadpool(nric_match.lookup_scan, scan, patient_logic.clinic_view_data)
+    audit.record(
+        "mykad_lookup", request, session,
+        nric=result["profile"]["nric_number"] if result["profile"] else scan["nric"],
+        patient_id=result["patient_id"], outcome=result["match"], raw_ocr=scan["raw_ocr"],
+        candidates=[c["user_id"] for c in result["candidates"]],
+    )
+    return result
 
 # view patient data limited to their role
 @router.get(
@@ -28,7 +58,8 @@ async def ocr_mykadscan(file: UploadFile = File(...), db: Session = Depends(get_
 )
 def get_patient_profile_clinic(
     nric: str,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(sharding.get_patient_db),
     session=Depends(require_auth(["clinic_admin"]))
 ):
     patient = (
@@ -38,45 +69,50 @@ def get_patient_profile_clinic(
     )
 
     if not patient:
+        audit.record("profile_read", request, session, nric=nric, outcome="not_found")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Patient not found"
         )
 
-    prescriptions = [
-        {
-            "prescription_name": p.prescription_name,
-            "prescription_dose": p.prescription_dose,
-            "date": p.date,
-            "additional_info": p.additional_info,
-        }
-        for p in patient.prescriptions
-    ]
-
-    presenting_complaint = [
-        {
-            "complaint": c.complaint,
-            "date": c.date,
-            "additional_info": c.additional_info,
-        }
-        for c in patient.presenting_complaint
-    ]
-
-    return {
-        "full_name": patient.full_name,
-        "sex": patient.sex,
-        "birth_date": patient.birth_date,
-        "nric_number": patient.nric_number,
-        "prescriptions": prescriptions,
-        "presenting_complaint": presenting_complaint,
-    }
+    audit.record("profile_read", request, session, nric=nric, patient_id=patient.id)
+    return patient_logic.clinic_view_data(patient)
+
+# find patients by partial name or NRIC, e.g. when the scanned NRIC doesn't match anyone
+@router.get(
+    "/viewpatientdata/search",
+    response_model=schemas.PatientSearchResponse
+)
+def search_patients_clinic(
+    q: str,
+    request: Request,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    session=Depends(require_auth(["clinic_admin"]))
+):
+    result = patient_search.search_patients(q, limit, cursor)
+    audit.record("patient_search", request, session, query=q, results=[r["user_id"] for r in result["results"]])
+    return result
+
+# changes since the clinic's last sync, for its offline copy (NDJSON, see backend/core/sync.py)
+@router.get("/sync")
+def sync_changes(
+    request: Request,
+    since: str = "0",
+    limit: int = 1000,
+    session=Depends(require_auth(["clinic_admin"]))
+):
+    response = sync.sync_response(since, limit)
+    audit.record("sync", request, session, since=since, next_since=response.headers["X-Next-Since"])
+    return response
 
 # add prescription or complaints
 @router.post("/viewpatientdata/update")
 def clinic_add_patient_records(
     nric: str,
+    request: Request,
     payload: schemas.ClinicPatientUpdateRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(sharding.get_patient_db),
     session=Depends(require_auth(["clinic_admin"]))
 ):
     patient = (
@@ -86,6 +122,7 @@ def clinic_add_patient_records(
     )
 
     if not patient:
+        audit.record("profile_update", request, session, nric=nric, outcome="not_found")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Patient not found"
@@ -102,6 +139,8 @@ def clinic_add_patient_records(
                 patient_id=patient.id,
             )
             db.add(db_prescription)
+        new_medications = vocabulary.link_terms(db, patient.id, "medication", [p.prescription_name for p in payload.prescriptions])
+        aggregates.record_new_terms(db, "medication", new_medications)
 
     # Add presenting complaints
     if payload.presenting_complaint:
@@ -116,4 +155,9 @@ def clinic_add_patient_records(
 
     db.commit()
 
+    audit.record(
+        "profile_update", request, session, nric=nric, patient_id=patient.id,
+        prescriptions_added=len(payload.prescriptions or []),
+        complaints_added=len(payload.presenting_complaint or []),
+    )
     return {"status": "success", "message": "Patient records updated"}
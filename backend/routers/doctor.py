@@ -1,5 +1,6 @@
 # external imports
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 from sqlalchemy.orm import Session
 from datetime import datetime, date, timedelta
@@ -8,7 +9,9 @@ from datetime import datetime, date, timedelta
 from backend.db import get_db
 from backend.auth import require_auth
 from backend.core.ocrmodule import ocr_mykad_image
-from backend.core import patient_logic
+from backend.core.admission import rate_limit_ocr
+from backend.core import ocr_jobs, audit
+from backend.core import patient_logic, patient_search, nric_match, vocabulary, emergency, sharding
 import backend.schemas as schemas
 
 router = APIRouter()
@@ -16,53 +19,86 @@ router = APIRouter()
 """ DOCTOR VIEWING PATIENT DATA"""
 
 # confirmed by frontend, this is to get data from ic scan and return that text to frontend
-@router.post("/viewpatientdata/mykadscan")
-async def ocr_mykadscan(file: UploadFile = File(...), db: Session = Depends(get_db), session=Depends(require_auth(["doctor"]))):
-    # reminder: save raw ocr text to database
-    return await ocr_mykad_image(file)
+@router.post("/viewpatientdata/mykadscan", dependencies=[Depends(rate_limit_ocr)])
+async def ocr_mykadscan(request: Request, file: UploadFile = File(...), db: Session = Depends(get_db), session=Depends(require_auth(["doctor"]))):
+    scan = await ocr_mykad_image(file)
+    audit.record("mykad_scan", request, session, nric=scan["nric"], raw_ocr=scan["raw_ocr"])
+    return scan
+
+# same scan as above, but answered straight away with a job id; poll the job or listen on its events
+@router.post("/viewpatientdata/mykadscan/jobs", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(rate_limit_ocr)])
+async def submit_ocr_job(request: Request, file: UploadFile = File(...), session=Depends(require_auth(["doctor"]))):
+    return await ocr_jobs.submit_job(file, request, session)
+
+@router.get("/viewpatientdata/mykadscan/jobs/{job_id}")
+def get_ocr_job(job_id: str, request: Request, session=Depends(require_auth(["doctor"]))):
+    return ocr_jobs.job_status(job_id, request)
+
+@router.get("/viewpatientdata/mykadscan/jobs/{job_id}/events")
+def get_ocr_job_events(job_id: str, request: Request, session=Depends(require_auth(["doctor"]))):
+    return ocr_jobs.job_events(job_id, request)
+
+# scan and find the patient in one request: the profile on an exact NRIC match, otherwise ranked candidates
+@router.post("/viewpatientdata/mykadscan/lookup", response_model=schemas.MykadLookupResponse, dependencies=[Depends(rate_limit_ocr)])
+async def ocr_mykadscan_lookup(request: Request, file: UploadFile = File(...), session=Depends(require_auth(["doctor"]))):
+    scan = await ocr_mykad_image(file)
+    result = await run_in_threadpool(nric_match.lookup_scan, scan, patient_logic.patient_profile_data)
+    audit.record(
+        "mykad_lookup", request, session,
+        nric=result["profile"]["nric_number"] if result["profile"] else scan["nric"],
+        patient_id=result["patient_id"], outcome=result["match"], raw_ocr=scan["raw_ocr"],
+        candidates=[c["user_id"] for c in result["candidates"]],
+    )
+    return result
 
 # view patient data
-@router.get("/viewpatientdata/profile", response_model=schemas.PatientDataResponse)
-def get_patient_profile(nric: str, db: Session = Depends(get_db), session=Depends(require_auth(["doctor"]))):
-    # Query patient by NRIC
-    patient = db.query(patient_logic.Patient).filter(patient_logic.Patient.nric_number == nric).first()
+# ?fields=blood_type,allergies returns (and loads) only those fields
+@router.get("/viewpatientdata/profile", response_model=schemas.PatientDataPartialResponse, response_model_exclude_unset=True)
+def get_patient_profile(nric: str, request: Request, fields: Optional[str] = None, db: Session = Depends(sharding.get_patient_db), session=Depends(require_auth(["doctor"]))):
+    selected = patient_logic.parse_profile_fields(fields)
+    patient = patient_logic.load_patient_profile(db, nric, selected)
     if not patient:
+        audit.record("profile_read", request, session, nric=nric, outcome="not_found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
 
-    major_surgeries = [
-        {"surgery_name": s.surgery_name, "date": s.date, "additional_info": s.additional_info}
-        for s in patient.major_surgeries
-    ]
-    prescriptions = [
-        {"prescription_name": p.prescription_name, "prescription_dose": p.prescription_dose, "date": p.date, "additional_info": p.additional_info}
-        for p in patient.prescriptions
-    ]
-    immunization = [
-        {"immunization_name": i.immunization_name, "date": i.date, "additional_info": i.additional_info}
-        for i in patient.immunization
-    ]
-    presenting_complaint = [
-        {"complaint": c.complaint, "date": c.date, "additional_info": c.additional_info}
-        for c in patient.presenting_complaint
-    ]
-    emergency_contacts = [
-        {"name": e.name, "contact_number": e.contact_number, "address": e.address, "date_added": e.date_added, "additional_info": e.additional_info}
-        for e in patient.emergency_contacts
-    ]
+    audit.record("profile_read", request, session, nric=nric, patient_id=patient.id, fields=selected)
+    return patient_logic.patient_profile_data(patient, selected)
+
+# emergency card from this worker's in-memory index (database on a miss), see backend/core/emergency.py
+@router.get("/emergency", response_model=schemas.EmergencyCardResponse)
+def get_emergency_card(nric: str, request: Request, session=Depends(require_auth(["doctor"]))):
+    card, source = emergency.lookup(nric)
+    if not card:
+        audit.record("emergency_read", request, session, nric=nric, outcome="not_found")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
+
+    audit.record("emergency_read", request, session, nric=nric, patient_id=int(card["user_id"]), source=source)
+    return card
+
+# find patients by partial name or NRIC, e.g. when the scanned NRIC doesn't match anyone
+@router.get("/viewpatientdata/search", response_model=schemas.PatientSearchResponse)
+def search_patients(q: str, request: Request, limit: int = 20, cursor: Optional[str] = None, session=Depends(require_auth(["doctor"]))):
+    result = patient_search.search_patients(q, limit, cursor)
+    audit.record("patient_search", request, session, query=q, results=[r["user_id"] for r in result["results"]])
+    return result
 
-    return {
-        "full_name": patient.full_name,
-        "birth_date": patient.birth_date,
-        "nric_number": patient.nric_number,
-        "sex": patient.sex,
-        "blood_type": patient.blood_type,
-        "allergies": patient.allergies,
-        "chronic_conditions": patient.chronic_conditions,
-        "major_surgeries": major_surgeries,
-        "prescriptions": prescriptions,
-        "immunization": immunization,
-        "presenting_complaint": presenting_complaint,
-        "risk_factors": patient.risk_factors,
-        "advanced_directives": patient.advanced_directives,
-        "emergency_contacts": emergency_contacts,
-    }
\ No newline at end of file
+# patients with all of the given terms, e.g. ?allergy=penicillin&chronic_condition=asthma
+@router.get("/cohort", response_model=schemas.CohortResponse)
+def cohort(
+    request: Request,
+    allergy: Optional[str] = None,
+    chronic_condition: Optional[str] = None,
+    medication: Optional[str] = None,
+    immunization: Optional[str] = None,
+    after: int = 0,
+    limit: int = 100,
+    session=Depends(require_auth(["doctor"]))
+):
+    filters = {
+        kind: value
+        for kind, value in [("allergy", allergy), ("chronic_condition", chronic_condition), ("medication", medication), ("immunization", immunization)]
+        if value
+    }
+    result = vocabulary.cohort_patients(filters, after, limit)
+    audit.record("cohort_query", request, session, filters=filters, results=len(result["results"]))
+    return result
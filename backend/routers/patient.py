@@ -1,5 +1,5 @@
 # external imports
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, status
 from typing import Optional
 from sqlalchemy.orm import Session
 from datetime import datetime, date, timedelta
@@ -8,7 +8,9 @@ from datetime import datetime, date, timedelta
 from backend.db import get_db
 from backend.auth import require_auth
 from backend.core.ocrmodule import ocr_mykad_image
-from backend.core import patient_logic
+from backend.core.admission import rate_limit_ocr
+from backend.core import ocr_jobs, audit
+from backend.core import patient_logic, vocabulary, aggregates, sharding
 import backend.schemas as schemas
 
 router = APIRouter()
@@ -17,11 +19,12 @@ router = APIRouter()
 # no token check required
 
 # this is only to save raw ocr text and make sure data read is strictly backend, name and ic confirmation incase of type will be updated later
-@router.post("/mykadscan/initial")
-async def ocr_mykadscan(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    # reminder: save raw ocr text to database
+@router.post("/mykadscan/initial", dependencies=[Depends(rate_limit_ocr)])
+async def ocr_mykadscan(request: Request, file: UploadFile = File(...), db: Session = Depends(get_db)):
     try:
-        return await ocr_mykad_image(file)
+        scan = await ocr_mykad_image(file)
+        audit.record("mykad_scan", request, nric=scan["nric"], raw_ocr=scan["raw_ocr"])
+        return scan
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -29,42 +32,64 @@ async def ocr_mykadscan(file: UploadFile = File(...), db: Session = Depends(get_
         # Catch any unexpected errors and return proper error response
         raise HTTPException(status_code=500, detail=f"Error processing MyKad scan: {str(e)}")
 
+# same scan as above, but answered straight away with a job id; poll the job or listen on its events
+@router.post("/mykadscan/initial/jobs", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(rate_limit_ocr)])
+async def submit_ocr_job(request: Request, file: UploadFile = File(...)):
+    return await ocr_jobs.submit_job(file, request)
+
+@router.get("/mykadscan/initial/jobs/{job_id}")
+def get_ocr_job(job_id: str, request: Request):
+    return ocr_jobs.job_status(job_id, request)
+
+@router.get("/mykadscan/initial/jobs/{job_id}/events")
+def get_ocr_job_events(job_id: str, request: Request):
+    return ocr_jobs.job_events(job_id, request)
+
 # final registration function
 @router.post("/mykadscan/confirmation")
 def confirm_mykadscan(
     payload: patient_logic.PatientRegistrationConfirm,
-    db: Session = Depends(get_db),
+    request: Request,
     session=Depends(require_auth(["patient"]))
 ):
-    existing_patient = (
-        db.query(patient_logic.Patient)
-        .filter(patient_logic.Patient.nric_number == payload.nric_number)
-        .first()
-    )
+    # the patient is stored on the shard of their NRIC (backend/core/sharding.py)
+    with sharding.patient_session(payload.nric_number) as db:
+        existing_patient = (
+            db.query(patient_logic.Patient)
+            .filter(patient_logic.Patient.nric_number == payload.nric_number)
+            .first()
+        )
 
-    if existing_patient:
-        return {
-            "status": "exists",
-            "patient_id": existing_patient.id,
-            "message": "Patient record already exists"
-        }
+        if existing_patient:
+            audit.record("register", request, session, nric=payload.nric_number, patient_id=existing_patient.id, outcome="exists")
+            return {
+                "status": "exists",
+                "patient_id": existing_patient.id,
+                "message": "Patient record already exists"
+            }
 
-    new_patient = patient_logic.Patient(
-        full_name=payload.full_name,
-        birth_date=payload.birth_date,
-        nric_number=payload.nric_number,
-        sex=payload.sex,
-        blood_type=payload.blood_type,
+        new_patient = patient_logic.Patient(
+            full_name=payload.full_name,
+            birth_date=payload.birth_date,
+            nric_number=payload.nric_number,
+            sex=payload.sex,
+            blood_type=payload.blood_type,
 
-        allergies=payload.allergies,
-        chronic_conditions=payload.chronic_conditions,
-        risk_factors=payload.risk_factors
-    )
+            allergies=payload.allergies,
+            chronic_conditions=payload.chronic_conditions,
+            risk_factors=payload.risk_factors
+        )
 
-    db.add(new_patient)
-    db.commit()
-    db.refresh(new_patient)
+        db.add(new_patient)
+        db.flush()
+        # cohort vocabulary and analytics counts, same transaction as the patient
+        vocabulary.link_terms(db, new_patient.id, "allergy", payload.allergies)
+        vocabulary.link_terms(db, new_patient.id, "chronic_condition", payload.chronic_conditions)
+        aggregates.record_registration(db, new_patient)
+        db.commit()
+        db.refresh(new_patient)
 
+    audit.record("register", request, session, nric=payload.nric_number, patient_id=new_patient.id, outcome="created")
     return {
         "status": "created",
         "patient_id": new_patient.id,
@@ -72,47 +97,14 @@ def confirm_mykadscan(
     }
 
 # view own data
-@router.get("/profile", response_model=schemas.PatientDataResponse)
-def get_patient_profile(nric: str, db: Session = Depends(get_db), session=Depends(require_auth(["patient"]))):
-    patient = db.query(patient_logic.Patient).filter(patient_logic.Patient.nric_number == nric).first()
+# ?fields=blood_type,allergies returns (and loads) only those fields
+@router.get("/profile", response_model=schemas.PatientDataPartialResponse, response_model_exclude_unset=True)
+def get_patient_profile(nric: str, request: Request, fields: Optional[str] = None, db: Session = Depends(sharding.get_patient_db), session=Depends(require_auth(["patient"]))):
+    selected = patient_logic.parse_profile_fields(fields)
+    patient = patient_logic.load_patient_profile(db, nric, selected)
     if not patient:
+        audit.record("profile_read", request, session, nric=nric, outcome="not_found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
 
-    major_surgeries = [
-        {"surgery_name": s.surgery_name, "date": s.date, "additional_info": s.additional_info}
-        for s in patient.major_surgeries
-    ]
-    prescriptions = [
-        {"prescription_name": p.prescription_name, "prescription_dose": p.prescription_dose, "date": p.date, "additional_info": p.additional_info}
-        for p in patient.prescriptions
-    ]
-    immunization = [
-        {"immunization_name": i.immunization_name, "date": i.date, "additional_info": i.additional_info}
-        for i in patient.immunization
-    ]
-    presenting_complaint = [
-        {"complaint": c.complaint, "date": c.date, "additional_info": c.additional_info}
-        for c in patient.presenting_complaint
-    ]
-    emergency_contacts = [
-        {"name": e.name, "contact_number": e.contact_number, "address": e.address, "date_added": e.date_added, "additional_info": e.additional_info}
-        for e in patient.emergency_contacts
-    ]
-
-    return {
-        "full_name": patient.full_name,
-        "birth_date": patient.birth_date,
-        "nric_number": patient.nric_number,
-        "sex": patient.sex,
-        "blood_type": patient.blood_type,
-        "allergies": patient.allergies,
-        "chronic_conditions": patient.chronic_conditions,
-        "major_surgeries": major_surgeries,
-        "prescriptions": prescriptions,
-        "immunization": immunization,
-        "presenting_complaint": presenting_complaint,
-        "risk_factors": patient.risk_factors,
-        "advanced_directives": patient.advanced_directives,
-        "emergency_contacts": emergency_contacts,
-        "user_id": str(patient.id)
-    }
\ No newline at end of file
+    audit.record("profile_read", request, session, nric=nric, patient_id=patient.id, fields=selected)
+    return patient_logic.patient_profile_data(patient, selected)
\ No newline at end of file
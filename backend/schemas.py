@@ -66,6 +66,47 @@ class PatientDataCreate(PatientDataBase):
 class PatientDataResponse(PatientDataBase):
     user_id: str = Field(..., examples=["abc123xyz"])
 
+# profile with ?fields=..., only the requested keys are sent (response_model_exclude_unset)
+
+class PatientDataPartialResponse(BaseModel):
+    full_name: str | None = Field(None, examples=["ALI BIN ABU"])
+    birth_date: date_type | None = None
+    nric_number: str | None = Field(None, examples=["061111111111"])
+    sex: str | None = Field(None, examples=["male", "female"])
+    blood_type: str | None = Field(None, examples=["O-"])
+
+    allergies: list[str] | None = None
+    chronic_conditions: list[str] | None = None
+
+    major_surgeries: list[PreviousMajorSurgeries] | None = None
+    prescriptions: list[MedicationPrescription] | None = None
+    immunization: list[Immunization] | None = None
+    presenting_complaint: list[PresentingComplaint] | None = None
+
+    risk_factors: list[str] | None = None
+    advanced_directives: list[str] | None = None
+    emergency_contacts: list[EmergencyContact] | None = None
+
+    user_id: str | None = Field(None, examples=["abc123xyz"])
+
+# emergency card, the critical subset of the profile
+
+class EmergencyContactCard(BaseModel):
+    name: str
+    contact_number: str
+    address: Optional[str] = None
+    additional_info: Optional[str] = None
+
+class EmergencyCardResponse(BaseModel):
+    user_id: str = Field(..., examples=["42"])
+    nric_number: str = Field(..., examples=["061111111111"])
+    full_name: str = Field(..., examples=["ALI BIN ABU"])
+    blood_type: str = Field(..., examples=["O-"])
+    allergies: list[str]
+    chronic_conditions: list[str]
+    advanced_directives: list[str]
+    emergency_contacts: list[EmergencyContactCard]
+
 # clinic admin purposes
 
 class ClinicPatientViewResponse(BaseModel):
@@ -80,3 +121,67 @@ class ClinicPatientViewResponse(BaseModel):
 class ClinicPatientUpdateRequest(BaseModel):
     prescriptions: list[MedicationPrescription] | None = None
     presenting_complaint: list[PresentingComplaint] | None = None
+
+# patient search
+
+class PatientSearchResult(BaseModel):
+    user_id: str = Field(..., examples=["42"])
+    full_name: str = Field(..., examples=["ALI BIN ABU"])
+    nric_number: str = Field(..., examples=["061111111111"])
+    birth_date: date_type
+    sex: str = Field(..., examples=["male", "female"])
+    match: str = Field(..., examples=["exact", "near"])
+
+class PatientSearchResponse(BaseModel):
+    results: list[PatientSearchResult]
+    next_cursor: Optional[str] = None
+
+# cohort queries over the clinical vocabulary
+
+class CohortPatient(BaseModel):
+    user_id: str = Field(..., examples=["42"])
+    full_name: str = Field(..., examples=["ALI BIN ABU"])
+    nric_number: str = Field(..., examples=["061111111111"])
+    birth_date: date_type
+    sex: str = Field(..., examples=["male", "female"])
+
+class CohortResponse(BaseModel):
+    results: list[CohortPatient]
+    next_after: Optional[int] = None
+
+# analytics
+
+class CohortCounts(BaseModel):
+    total: int
+    blood_type: dict[str, int]
+    sex: dict[str, int]
+    age_band: dict[str, int] = Field(..., examples=[{"0-17": 10, "18-39": 52, "40-59": 31, "60-79": 12, "80+": 2}])
+    chronic_condition: dict[str, int]
+    medication: dict[str, int]
+
+# fused mykad scan and lookup
+
+class MykadScanRead(BaseModel):
+    nric: Optional[str] = Field(None, examples=["061111-11-1111"])
+    name: Optional[str] = Field(None, examples=["ALI BIN ABU"])
+    # true when OCR ran out of time before reading both fields
+    partial: bool = False
+    confidence: Optional[float] = Field(None, examples=[1.0])
+
+class NricMatchCandidate(BaseModel):
+    user_id: str = Field(..., examples=["42"])
+    full_name: str = Field(..., examples=["ALI BIN ABU"])
+    nric_number: str = Field(..., examples=["061111111111"])
+    birth_date: date_type
+    sex: str = Field(..., examples=["male", "female"])
+    edits: int = Field(..., examples=[1])
+    name_similarity: Optional[float] = Field(None, examples=[0.92])
+
+class MykadLookupResponse(BaseModel):
+    scan: MykadScanRead
+    match: str = Field(..., examples=["exact", "near", "none"])
+    profile: Optional[PatientDataResponse] = None
+    candidates: list[NricMatchCandidate] = []
+
+class ClinicMykadLookupResponse(MykadLookupResponse):
+    profile: Optional[ClinicPatientViewResponse] = None
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+"""
+End-to-end load and latency benchmark.
+
+Seeds a database with synthetic patients (plus child records) and drives the
+real FastAPI app in-process through httpx's ASGI transport, so the numbers
+include routing, auth, validation, SQLAlchemy and serialization but no network.
+
+Scenarios:
+  login              POST /auth/login
+  doctor_profile     GET  /doctor/viewpatientdata/profile
+  patient_profile    GET  /patient/profile
+  clinic_profile     GET  /clinicadmin/viewpatientdata/profile
+  clinic_update      POST /clinicadmin/viewpatientdata/update
+  register           POST /patient/mykadscan/confirmation
+
+Usage (from the project root):
+    python benchmarks/load_bench.py --patients 10000 --concurrency 16 --requests 2000
+    python benchmarks/load_bench.py --scenarios doctor_profile,clinic_update --output load.json
+    python benchmarks/load_bench.py --shards 4 --database /tmp/bench4.db --scenarios register,clinic_update
+    python benchmarks/load_bench.py --workers 4 --concurrency 4 --scenarios register,clinic_update
+
+The database defaults to benchmarks/bench.db so the real backend/app.db is left
+alone; pass `--database backend/app.db` to seed and benchmark that instead.
+With --shards N the patients are spread over N shard files next to it (see
+backend/core/sharding.py); use a separate --database per shard count.
+With --workers N, N processes (like uvicorn workers) run each scenario at the
+same time against the same database, each with --concurrency requests in
+flight; their latencies are reported together.
+Prints a JSON report (throughput, p50/p95/p99 latency per scenario).
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+SCENARIOS = ["login", "doctor_profile", "patient_profile", "clinic_profile", "clinic_update", "register"]
+
+BLOOD_TYPES = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
+ALLERGIES = ["penicillin", "peanuts", "latex", "sulfa drugs", "shellfish", "aspirin"]
+CONDITIONS = ["asthma", "diabetes type 2", "hypertension", "epilepsy", "ckd stage 3"]
+DRUGS = ["paracetamol 500mg", "amoxicillin 250mg", "metformin 500mg", "salbutamol inhaler", "amlodipine 5mg"]
+FIRST_NAMES = ["ALI", "SITI", "AHMAD", "NUR", "TAN", "LIM", "RAJ", "PRIYA", "WONG", "AISYAH"]
+LAST_NAMES = ["ABU", "HASSAN", "ISMAIL", "KUMAR", "CHONG", "YUSOF", "RAHMAN", "LEE", "OMAR", "DEVI"]
+
+
+def synthetic_nric(index: int, birth_date: date):
+    """Unique 12-digit NRIC: YYMMDD + 6 digits derived from the index"""
+    return f"{birth_date:%y%m%d}{index % 1_000_000:06d}"
+
+
+def seed_database(patients: int, children: int, seed: int):
+    """Bulk insert synthetic patients and `children` rows per child table per patient"""
+    from sqlalchemy import func, select
+    from backend.db import engine, init_db
+    from backend.core import patient_logic as pl, sharding
+
+    init_db()
+    rng = random.Random(seed)
+
+    # seeded into the first shard, then moved to the right ones
+    existing = sum(sharding.fan_out(lambda db: db.scalar(select(func.count()).select_from(pl.Patient.__table__))))
+    if existing >= patients:
+        return existing, 0
+    next_id = max(sharding.fan_out(lambda db: db.scalar(select(func.max(pl.Patient.__table__.c.id))) or 0)) + 1
+
+    created = 0
+    batch_size = 2000
+    while existing + created < patients:
+        count = min(batch_size, patients - existing - created)
+        patient_rows, surgeries, prescriptions, immunizations, complaints, contacts = [], [], [], [], [], []
+        for patient_id in range(next_id, next_id + count):
+            birth_date = date(1950, 1, 1) + timedelta(days=rng.randrange(0, 365 * 60))
+            patient_rows.append({
+                "id": patient_id,
+                "full_name": f"{rng.choice(FIRST_NAMES)} BIN {rng.choice(LAST_NAMES)}",
+                "birth_date": birth_date,
+                "nric_number": synthetic_nric(patient_id, birth_date),
+                "sex": rng.choice(["male", "female"]),
+                "blood_type": rng.choice(BLOOD_TYPES),
+                "allergies": rng.sample(ALLERGIES, rng.randrange(0, 3)),
+                "chronic_conditions": rng.sample(CONDITIONS, rng.randrange(0, 3)),
+                "risk_factors": ["smoker"] if rng.random() < 0.2 else [],
+                "advanced_directives": [],
+            })
+            for n in range(children):
+                day = date(2020, 1, 1) + timedelta(days=rng.randrange(0, 1500))
+                surgeries.append({"patient_id": patient_id, "surgery_name": "appendectomy", "date": day, "additional_info": "uneventful"})
+                prescriptions.append({"patient_id": patient_id, "prescription_name": rng.choice(DRUGS), "prescription_dose": "2x a day", "date": day, "additional_info": "seeded"})
+                immunizations.append({"patient_id": patient_id, "immunization_name": "influenza vaccine", "date": day, "additional_info": "annual"})
+                complaints.append({"patient_id": patient_id, "complaint": "fever", "date": day, "additional_info": "3 days"})
+                contacts.append({"patient_id": patient_id, "name": "NEXT OF KIN", "contact_number": f"+6012{rng.randrange(10**7):07d}", "address": "jalan 5 petaling jaya", "date_added": day, "additional_info": "spouse"})
+
+        with engine.begin() as conn:
+            conn.execute(pl.Patient.__table__.insert(), patient_rows)
+            for model, rows in [
+                (pl.PreviousMajorSurgeries, surgeries),
+                (pl.MedicationPrescription, prescriptions),
+                (pl.Immunization, immunizations),
+                (pl.PresentingComplaint, complaints),
+                (pl.EmergencyContact, contacts),
+            ]:
+                if rows:
+                    conn.execute(model.__table__.insert(), rows)
+
+        next_id += count
+        created += count
+
+    if sharding.SHARD_COUNT > 1:
+        sharding.rebalance(sharding.SHARD_COUNT)
+    return existing + created, created
+
+
+def load_nrics(limit: int):
+    from sqlalchemy import select
+    from backend.core import patient_logic as pl, sharding
+
+    per_shard = -(-limit // sharding.SHARD_COUNT)
+    query = select(pl.Patient.__table__.c.nric_number).limit(per_shard)
+    return [nric for nrics in sharding.fan_out(lambda db: db.scalars(query).all()) for nric in nrics]
+
+
+# registrations use NRICs 900100xxxxxx: day 00, so the seeder never produces them
+REGISTER_PREFIX = "900100"
+
+
+def next_register_number():
+    """First unused number after REGISTER_PREFIX, so reruns against the same database register new patients"""
+    from sqlalchemy import func, select
+    from backend.core import patient_logic as pl, sharding
+
+    nric = pl.Patient.__table__.c.nric_number
+    query = select(func.max(nric)).where(nric.like(REGISTER_PREFIX + "%"), func.length(nric) == 12)
+    stored = [top for top in sharding.fan_out(lambda db: db.scalar(query)) if top]
+    return max(int(top[len(REGISTER_PREFIX):]) for top in stored) + 1 if stored else 0
+
+
+def percentile(sorted_values, pct: float):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def run_scenario(make_request, total: int, concurrency: int, offset: int = 0):
+    """`total` requests numbered from `offset`: (latencies, {status: count}, elapsed seconds)"""
+    latencies = []
+    statuses = {}
+    remaining = iter(range(offset, offset + total))
+
+    async def worker():
+        for i in remaining:
+            start = time.perf_counter()
+            response = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def summarize(latencies, statuses, elapsed: float, concurrency: int):
+    latencies = sorted(latencies)
+    total = len(latencies)
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        },
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": errors,
+    }
+
+
+async def run_benchmark(args, nrics, register_base: int, worker: int = 0, barrier=None):
+    """{scenario: run_scenario result} for this process; `worker` of args.workers, all starting each
+    scenario together at `barrier`"""
+    import httpx
+    from backend.main import app
+
+    rng = random.Random(args.seed)
+    today = date.today()
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def login(role: str):
+                response = await client.post("/auth/login", json={"user_id": 1, "role": role})
+                return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            headers = {role: await login(role) for role in ["doctor", "patient", "clinic_admin"]}
+
+            requests = {
+                "login": lambda i: client.post("/auth/login", json={"user_id": i, "role": "doctor"}),
+                "doctor_profile": lambda i: client.get(
+                    "/doctor/viewpatientdata/profile", params={"nric": rng.choice(nrics)}, headers=headers["doctor"]),
+                "patient_profile": lambda i: client.get(
+                    "/patient/profile", params={"nric": rng.choice(nrics)}, headers=headers["patient"]),
+                "clinic_profile": lambda i: client.get(
+                    "/clinicadmin/viewpatientdata/profile", params={"nric": rng.choice(nrics)}, headers=headers["clinic_admin"]),
+                "clinic_update": lambda i: client.post(
+                    "/clinicadmin/viewpatientdata/update",
+                    params={"nric": rng.choice(nrics)},
+                    headers=headers["clinic_admin"],
+                    json={
+                        "prescriptions": [{"prescription_name": rng.choice(DRUGS), "prescription_dose": "1x daily", "date": str(today), "additional_info": "load test"}],
+                        "presenting_complaint": [{"complaint": "cough", "date": str(today), "additional_info": "load test"}],
+                    }),
+                "register": lambda i: client.post(
+                    "/patient/mykadscan/confirmation",
+                    headers=headers["patient"],
+                    json={
+                        "full_name": "LOAD TEST PATIENT",
+                        "birth_date": "1990-01-01",
+                        # interleaved across workers so no two register the same NRIC
+                        "nric_number": f"{REGISTER_PREFIX}{register_base + i * args.workers + worker:06d}",
+                        "sex": "female",
+                        "blood_type": "O+",
+                        "allergies": ["latex"],
+                        "chronic_conditions": [],
+                        "risk_factors": [],
+                    }),
+            }
+
+            results = {}
+            for name in args.scenarios:
+                # a short warm-up so one-off costs (first query compile, imports) aren't measured
+                warmup = min(args.warmup, args.requests)
+                await run_scenario(requests[name], warmup, args.concurrency)
+                if barrier is not None:
+                    await asyncio.to_thread(barrier.wait)
+                # numbered on from the warm-up, so measured registrations are all new patients
+                results[name] = await run_scenario(requests[name], args.requests, args.concurrency, offset=warmup)
+            return results
+
+
+def run_worker(args, nrics, register_base, worker, barrier, results):
+    """Entry point of one --workers process"""
+    results.put(asyncio.run(run_benchmark(args, nrics, register_base, worker, barrier)))
+
+
+def run_workers(args, nrics, register_base):
+    """Run the scenarios in args.workers processes at once and merge what they measured"""
+    # spawned rather than forked: each worker opens its own connections, as uvicorn workers do
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(args.workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(args, nrics, register_base, worker, barrier, results))
+        for worker in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    outputs = []
+    try:
+        while len(outputs) < len(processes):
+            try:
+                outputs.append(results.get(timeout=1))
+            except queue.Empty:
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    raise SystemExit("a load_bench worker failed, see its traceback above")
+    finally:
+        for process in processes:
+            if process.is_alive() and len(outputs) < len(processes):
+                process.terminate()
+            process.join()
+
+    merged = {}
+    for name in args.scenarios:
+        latencies, statuses = [], {}
+        for output in outputs:
+            latencies.extend(output[name][0])
+            for status, count in output[name][1].items():
+                statuses[status] = statuses.get(status, 0) + count
+        # the workers started together, so the scenario lasted as long as the slowest one
+        elapsed = max(output[name][2] for output in outputs)
+        merged[name] = summarize(latencies, statuses, elapsed, args.concurrency * args.workers)
+    return merged
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic patients and load-test the API in-process")
+    parser.add_argument("--database", default=os.path.join(PROJECT_ROOT, "benchmarks", "bench.db"), help="SQLite file to seed and use")
+    parser.add_argument("--patients", type=int, default=5000, help="patients to have in the database")
+    parser.add_argument("--children", type=int, default=2, help="rows per child table per seeded patient")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent in-flight requests")
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured requests per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--shards", type=int, default=1, help="SHARD_COUNT to run with")
+    parser.add_argument("--workers", type=int, default=1, help="processes running the scenarios at once")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    # must be set before backend.db is imported
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(args.database)
+    os.environ["SHARD_COUNT"] = str(args.shards)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    seed_start = time.perf_counter()
+    total_patients, seeded = seed_database(args.patients, args.children, args.seed)
+    seed_seconds = time.perf_counter() - seed_start
+
+    nrics = load_nrics(limit=50_000)
+    register_base = next_register_number()
+    if args.workers > 1:
+        results = run_workers(args, nrics, register_base)
+    else:
+        measured = asyncio.run(run_benchmark(args, nrics, register_base))
+        results = {name: summarize(*measured[name], args.concurrency) for name in args.scenarios}
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "database": os.path.abspath(args.database),
+        "shards": args.shards,
+        "workers": args.workers,
+        "patients": total_patients,
+        "seeded_now": seeded,
+        "seed_s": round(seed_seconds, 3),
+        "children_per_table": args.children,
+        "scenarios": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+OCR accuracy and latency benchmark.
+
+Pushes every image of a synthetic corpus (see mykad_corpus.py) through
+backend.core.ocrmodule.ocr_mykad_image, the same function the scan routes use,
+and reports:
+  - latency per image and per OCR stage (decode, preprocess, psm_*, extraction)
+  - peak Python heap per image (tracemalloc) and the process peak RSS
+    (null on Windows, which has no `resource` module)
+  - field accuracy of extract_nric and extract_name against the ground truth,
+    overall and broken down by each degradation level
+
+Usage (from the project root, Tesseract must be installed):
+    python benchmarks/ocr_bench.py --count 100
+    python benchmarks/ocr_bench.py --corpus benchmarks/corpus --output ocr.json
+
+Without --corpus a corpus is generated into benchmarks/corpus first (reused on
+later runs with the same --count and --seed).
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from io import BytesIO
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def normalize_nric(value):
+    return re.sub(r"\D", "", value or "")
+
+
+def normalize_name(value):
+    return " ".join((value or "").upper().split())
+
+
+def load_or_generate_corpus(corpus_dir: str, count: int, seed: int):
+    from mykad_corpus import generate_corpus
+
+    manifest_path = os.path.join(corpus_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("seed") == seed and len(manifest["images"]) >= count:
+            manifest["images"] = manifest["images"][:count]
+            return manifest
+    return generate_corpus(corpus_dir, count, seed)
+
+
+def peak_rss_mb():
+    """Peak RSS of this process in MiB, None where the resource module is missing (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        "mean_ms": round(statistics.fmean(values) * 1000, 2),
+        "p50_ms": round(values[len(values) // 2] * 1000, 2),
+        "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2),
+    }
+
+
+async def scan_image(image_bytes: bytes):
+    from fastapi import HTTPException, UploadFile
+    from starlette.datastructures import Headers
+    from backend.core.metrics import collect_ocr_stages
+    from backend.core.ocrmodule import ocr_mykad_image
+
+    upload = UploadFile(file=BytesIO(image_bytes), filename="card.jpg", headers=Headers({"content-type": "image/jpeg"}))
+    with collect_ocr_stages() as stages:
+        start = time.perf_counter()
+        try:
+            result, error = await ocr_mykad_image(upload), None
+        except HTTPException as e:
+            result, error = {"nric": None, "name": None}, f"{e.status_code}: {str(e.detail)[:200]}"
+        elapsed = time.perf_counter() - start
+    return result, error, elapsed, dict(stages)
+
+
+async def run(manifest, corpus_dir: str):
+    from backend.core.ocrmodule import load_ocr
+
+    if not load_ocr():
+        raise SystemExit("[ERROR] Tesseract is not installed or not found, see docs/INSTALL_TESSERACT.md")
+
+    rows = []
+    tracemalloc.start()
+    for entry in manifest["images"]:
+        with open(os.path.join(corpus_dir, entry["file"]), "rb") as f:
+            image_bytes = f.read()
+
+        tracemalloc.reset_peak()
+        result, error, elapsed, stages = await scan_image(image_bytes)
+        _, peak_heap = tracemalloc.get_traced_memory()
+
+        rows.append({
+            "file": entry["file"],
+            "params": entry["params"],
+            "latency_s": elapsed,
+            "stages": stages,
+            "peak_heap_bytes": peak_heap,
+            "error": error,
+            "partial": bool(result.get("partial")),
+            "nric_ok": normalize_nric(result.get("nric")) == normalize_nric(entry["nric"]),
+            "name_ok": normalize_name(result.get("name")) == normalize_name(entry["name"]),
+        })
+    tracemalloc.stop()
+    return rows
+
+
+def accuracy(rows):
+    total = len(rows)
+    return {
+        "images": total,
+        "nric": round(sum(r["nric_ok"] for r in rows) / total, 4) if total else None,
+        "name": round(sum(r["name_ok"] for r in rows) / total, 4) if total else None,
+        "both": round(sum(r["nric_ok"] and r["name_ok"] for r in rows) / total, 4) if total else None,
+        "errors": sum(1 for r in rows if r["error"]),
+        # answered early because OCR_DEADLINE ran out
+        "partial": sum(1 for r in rows if r["partial"]),
+    }
+
+
+def build_report(rows, manifest):
+    stage_values = defaultdict(list)
+    for row in rows:
+        for stage, seconds in row["stages"].items():
+            stage_values[stage].append(seconds)
+
+    by_level = {}
+    for param in manifest["levels"]:
+        groups = defaultdict(list)
+        for row in rows:
+            groups[row["params"][param]].append(row)
+        by_level[param] = {
+            str(level): {**accuracy(group), "latency": summarize([r["latency_s"] for r in group])}
+            for level, group in sorted(groups.items())
+        }
+
+    return {
+        "images": len(rows),
+        "accuracy": accuracy(rows),
+        "latency": summarize([r["latency_s"] for r in rows]),
+        "stages": {stage: {**summarize(values), "calls": len(values)} for stage, values in sorted(stage_values.items())},
+        "memory": {
+            "peak_python_heap_mb_max": round(max(r["peak_heap_bytes"] for r in rows) / 2**20, 2) if rows else None,
+            "peak_python_heap_mb_mean": round(statistics.fmean(r["peak_heap_bytes"] for r in rows) / 2**20, 2) if rows else None,
+            "process_peak_rss_mb": peak_rss_mb(),
+        },
+        "by_level": by_level,
+        "failures": [
+            {"file": r["file"], "params": r["params"], "nric_ok": r["nric_ok"], "name_ok": r["name_ok"], "error": r["error"]}
+            for r in rows if not (r["nric_ok"] and r["name_ok"])
+        ][:50],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure OCR accuracy and latency on a synthetic MyKad corpus")
+    parser.add_argument("--corpus", default=os.path.join(PROJECT_ROOT, "benchmarks", "corpus"), help="corpus directory (generated if missing)")
+    parser.add_argument("--count", type=int, default=100, help="images to use")
+    parser.add_argument("--seed", type=int, default=7, help="corpus seed")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    manifest = load_or_generate_corpus(args.corpus, args.count, args.seed)
+    rows = asyncio.run(run(manifest, args.corpus))
+    report = build_report(rows, manifest)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Startup-time benchmark for the backend.
+
+Measures, each in a fresh interpreter so nothing is cached between runs:
+  - import cost of each entry point via `python -X importtime`
+      server      backend.main (every router loaded at startup)
+      serverless  api/index.py (routers loaded on first use, see backend/app_factory.py)
+  - cold-request latency per route family and entry point: import + lifespan
+    startup + the first request to that family, plus which heavy modules and
+    routers were loaded by the time it was answered
+
+Route families: health, auth, doctor, patient, clinicadmin, analytics, ocr
+(a MyKad scan; needs Tesseract to measure a real scan). Requests go to a copy
+of the database in DATABASE_URL (default backend/app.db) made in a temporary
+directory, along with the audit log, and brought up to the current schema with
+backend.init_db (as start_server.py does) before anything is measured, so the
+checked-in file is never written to; an unknown NRIC is used, so 404s are
+expected.
+
+Usage (from the project root):
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --runs 10 --output startup.json
+    python benchmarks/startup_bench.py --entries serverless --families health,doctor,ocr
+
+Prints JSON so results can be compared across commits.
+"""
+import argparse
+import json
+import os
+import statistics
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that should NOT be imported just to start the app
+HEAVY_MODULES = ["PIL", "pytesseract"]
+# reported per cold request: what serving that request had to load
+TRACKED_MODULES = ["sqlalchemy", "PIL", "pytesseract"]
+
+ENTRIES = {
+    "server": "backend.main",
+    "serverless": "api.index",
+}
+
+UNKNOWN_NRIC = "000000000000"
+# 1x1 white PNG, so the ocr family needs no image library before the timed request
+TINY_PNG_HEX = (
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000b49444154789c63f80f040009fb03fdfb5e6b2b0000"
+    "000049454e44ae426082"
+)
+
+# family -> (method, path, role or None)
+ROUTE_FAMILIES = {
+    "health": ("GET", "/health", None),
+    "auth": ("POST", "/auth/login", None),
+    "doctor": ("GET", f"/doctor/viewpatientdata/profile?nric={UNKNOWN_NRIC}", "doctor"),
+    "patient": ("GET", f"/patient/profile?nric={UNKNOWN_NRIC}", "patient"),
+    "clinicadmin": ("GET", f"/clinicadmin/viewpatientdata/profile?nric={UNKNOWN_NRIC}", "clinic_admin"),
+    "analytics": ("GET", "/analytics/cohorts", "doctor"),
+    "ocr": ("POST", "/doctor/viewpatientdata/mykadscan", "doctor"),
+}
+
+COLD_REQUEST_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+from {module} import app
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+from backend.auth import create_session
+method, path, role = {request!r}
+headers = {{"Authorization": "Bearer " + create_session(1, role)}} if role else {{}}
+kwargs = {{}}
+if path == "/auth/login":
+    kwargs["json"] = {{"user_id": 1, "role": "doctor"}}
+elif method == "POST":
+    kwargs["files"] = {{"file": ("card.png", bytes.fromhex({png!r}), "image/png")}}
+with TestClient(app) as client:
+    t2 = time.perf_counter()
+    response = client.request(method, path, headers=headers, **kwargs)
+    t3 = time.perf_counter()
+print(json.dumps({{
+    "import_s": t1 - t0,
+    "lifespan_s": t2 - t1,
+    "first_request_s": t3 - t2,
+    "total_s": (t1 - t0) + (t3 - t1),
+    "status": response.status_code,
+    "modules": [name for name in {tracked!r} if name in sys.modules],
+    "routers": sorted(name for name in sys.modules if name.startswith("backend.routers.")),
+}}))
+"""
+
+
+def bench_environment(directory: str):
+    """Environment for the measured interpreters: a copy of the SQLite database and the audit log
+    in `directory`, so the checked-in backend/app.db is never migrated or written to"""
+    source = os.getenv("DATABASE_URL", "sqlite:///" + os.path.join(PROJECT_ROOT, "backend", "app.db"))
+    if not source.startswith("sqlite:///"):
+        raise SystemExit(f"startup_bench needs a SQLite DATABASE_URL, got {source}")
+    database = os.path.join(directory, "app.db")
+    if os.path.exists(source[len("sqlite:///"):]):
+        shutil.copyfile(source[len("sqlite:///"):], database)
+
+    env = os.environ.copy()
+    env["DATABASE_URL"] = "sqlite:///" + database
+    env["AUDIT_DB_PATH"] = os.path.join(directory, "app.audit.db")
+    return env
+
+
+def run_python(args, env):
+    return subprocess.run(
+        [sys.executable] + args,
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+
+
+def parse_importtime(stderr: str):
+    """Parse `-X importtime` output into {module: (self_us, cumulative_us)}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return modules
+
+
+def measure_importtime(module: str, top: int, env):
+    result = run_python(["-X", "importtime", "-c", f"import {module}"], env)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = parse_importtime(result.stderr)
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        f"{module}_cumulative_ms": modules.get(module, (0, 0))[1] / 1000,
+        "modules_imported": len(modules),
+        "heavy_modules_imported": [name for name in HEAVY_MODULES if name in modules],
+        "slowest_self_ms": [
+            {"module": name, "self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000}
+            for name, (self_us, cumulative_us) in slowest
+        ],
+    }
+
+
+def measure_cold_requests(module: str, family: str, runs: int, env):
+    snippet = COLD_REQUEST_SNIPPET.format(
+        module=module, request=ROUTE_FAMILIES[family], png=TINY_PNG_HEX, tracked=TRACKED_MODULES
+    )
+    samples = []
+    for _ in range(runs):
+        result = run_python(["-c", snippet], env)
+        if result.returncode != 0:
+            raise RuntimeError(f"cold request run failed ({module}, {family}):\n{result.stderr[-2000:]}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    summary = {}
+    for key in ["import_s", "lifespan_s", "first_request_s", "total_s"]:
+        values = [sample[key] for sample in samples]
+        summary[key] = {
+            "median_ms": statistics.median(values) * 1000,
+            "min_ms": min(values) * 1000,
+            "max_ms": max(values) * 1000,
+        }
+    summary["statuses"] = sorted({sample["status"] for sample in samples})
+    summary["modules_loaded"] = samples[-1]["modules"]
+    summary["routers_loaded"] = samples[-1]["routers"]
+    return summary
+
+
+def parse_list(value: str, known):
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in items if item not in known]
+    if unknown:
+        raise SystemExit(f"unknown: {', '.join(unknown)} (choose from {', '.join(known)})")
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend import time and cold-request latency")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start per family and entry point")
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest imports to list")
+    parser.add_argument("--entries", default=",".join(ENTRIES), help="entry points to measure")
+    parser.add_argument("--families", default=",".join(ROUTE_FAMILIES), help="route families to measure")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    entries = parse_list(args.entries, ENTRIES)
+    families = parse_list(args.families, ROUTE_FAMILIES)
+
+    with tempfile.TemporaryDirectory(prefix="startup_bench_") as directory:
+        env = bench_environment(directory)
+        result = run_python(["-m", "backend.init_db"], env)
+        if result.returncode != 0:
+            raise RuntimeError(f"init_db failed on the benchmark database:\n{result.stderr[-2000:]}")
+        report = {
+            "python": sys.version.split()[0],
+            "importtime": {entry: measure_importtime(ENTRIES[entry], args.top, env) for entry in entries},
+            "cold_request": {
+                entry: {family: measure_cold_requests(ENTRIES[entry], family, args.runs, env) for family in families}
+                for entry in entries
+            },
+        }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -50,6 +50,11 @@ def main():
     print(f"[INFO] Railway environment detected: PORT={port}")
     
     try:
+        # Create the database schema once per deploy, before any worker starts
+        from backend.init_db import init_db
+        init_db()
+        print("[OK] Database schema ready")
+
         import uvicorn
         # Use import string format for proper module resolution
         # Railway will serve both frontend and backend from the same port
@@ -9,6 +9,11 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 def main():
     """Main entry point for the server"""
     try:
+        # Create the database schema once here, not in every (reloaded) worker
+        from backend.init_db import init_db
+        init_db()
+        print("[OK] Database schema ready")
+
         import uvicorn
         print("[OK] Uvicorn imported successfully")
         print("\nStarting server on http://127.0.0.1:8000")